@@ -7,62 +7,85 @@ plot_impact_and_cost_by_pfpr.
 """
 
 import os
+import sys
 import pandas as pd
 import numpy as np
 from simtools.Analysis.AnalyzeManager import AnalyzeManager
 from simtools.Analysis.BaseAnalyzers import BaseAnalyzer
 from simtools.SetupParser import SetupParser
 
-# from sim_output_processing.spatial_output_dataframe import construct_spatial_output_df
-from spatial_output_dataframe import construct_spatial_output_df
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from site_registry import SiteRegistry
+from report_json import summary_report
+from result_sink import ResultSink
+from spatial_reports import stack_spatial_reports, read_spatial_reports, node_columns
 
 projectdir = os.path.join('E:/', 'Dropbox (IDM)', 'Malaria Team Folder', 'projects', 'atsb')
 
 
 class ATSBAnalyzer(BaseAnalyzer):
 
-    def __init__(self, expt_name, report_names=["AnnualAverage"], sweep_variables=None, working_dir="."):
+    def __init__(self, expt_name, report_names=["AnnualAverage"], sweep_variables=None, working_dir=".",
+                 time_window=None, spatial_from_disk=False):
+        """
+        :param time_window: (start, stop) time steps the spatial channels are summed / averaged over; all by default
+        :param spatial_from_disk: read only the sites' nodes and the time window of each SpatialReport directly from the
+        simulation folders instead of having the whole files transferred (needs the outputs on a reachable file system,
+        e.g. on an SSMT work item)
+        """
+        spatial_channels = ["Population",
+                            "Blood_Smear_Parasite_Prevalence",
+                            'New_Infections',
+                            'New_Clinical_Cases']
         super(ATSBAnalyzer, self).__init__(working_dir=working_dir,
                                         filenames=["output/MalariaSummaryReport_{name}.json".format(name=name)
                                                       for name in report_names] +
-                                                  ['output/SpatialReport_%s.bin' % s for s in ["Population",
-                                                                                        "Blood_Smear_Parasite_Prevalence",
-                                                                                        'New_Infections',
-                                                                                        'New_Clinical_Cases']]
+                                                  ([] if spatial_from_disk else
+                                                   ['output/SpatialReport_%s.bin' % s for s in spatial_channels]),
+                                           parse=False
                                            )
+        self.time_window = slice(*time_window) if time_window else None
+        self.spatial_from_disk = spatial_from_disk
         self.sweep_variables = sweep_variables or ["Run_Number"]
         self.sitenames=report_names
         self.expt_name = expt_name
-        self.reference = pd.read_csv('site_details.csv')
-        self.spatial_channels = ["Population",
-                                 "Blood_Smear_Parasite_Prevalence",
-                                 'New_Infections',
-                                 'New_Clinical_Cases']
+        self.summary_channels = ['PfPR_2to10']
+        self.sink = ResultSink(os.path.join(working_dir, '%s' % expt_name))
+        registry = SiteRegistry()
+        self.nodeids = registry.nodeids([name for name in report_names if name in registry])
+        self.spatial_channels = spatial_channels
+
+    def filter(self, simulation):
+        # simulations already written by an earlier (interrupted) run are not fetched again
+        return not self.sink.done(simulation)
 
     def select_simulation_data(self, data, simulation):
         simdata = []
-        spatialdata = construct_spatial_output_df(data['output/SpatialReport_%s.bin' % self.spatial_channels[0]],
-                                                  self.spatial_channels[0])
-        if len(self.spatial_channels) > 1:
-            for ch in self.spatial_channels[1:]:
-                spatialdata = pd.merge(left=spatialdata,
-                                       right=construct_spatial_output_df(data['output/SpatialReport_%s.bin' % ch], ch),
-                                       on=['time', 'node'])
-
-        for site_name in self.sitenames:
-
-            channeldata = data["output/MalariaSummaryReport_{name}.json".format(name=site_name)]["DataByTime"]["PfPR_2to10"]
+        # (channel x time x node); incidence channels are summed over time, the others averaged
+        site_nodes = [self.nodeids[site_name] for site_name in self.sitenames]
+        if self.spatial_from_disk:
+            _, spatialdata = read_spatial_reports(os.path.join(simulation.get_path(), 'output'), self.spatial_channels,
+                                                  nodes=site_nodes, times=self.time_window)
+        else:
+            node_ids, spatialdata = stack_spatial_reports([data['output/SpatialReport_%s.bin' % ch]
+                                                           for ch in self.spatial_channels])
+            spatialdata = spatialdata[:, self.time_window or slice(None), node_columns(node_ids, site_nodes)]
+        site_values = np.where(np.isin(self.spatial_channels, ['New_Infections', 'New_Clinical_Cases'])[:, None],
+                               spatialdata.sum(axis=1, dtype=np.float64),
+                               spatialdata.mean(axis=1, dtype=np.float64))
+
+        for s, site_name in enumerate(self.sitenames):
+
+            report = summary_report(data["output/MalariaSummaryReport_{name}.json".format(name=site_name)],
+                                    self.summary_channels)
+            channeldata = report["DataByTime"]["PfPR_2to10"]
 
             sitedata = pd.DataFrame({'PfPR2to10': channeldata,
                                     "Site_Name": site_name})
             sitedata = sitedata[-2:-1]
 
-            nodeid = self.reference[self.reference['name'] == site_name]['nodeid'].values[0]
-            for ch in self.spatial_channels :
-                if ch in ['New_Infections', 'New_Clinical_Cases']:
-                    sitedata[ch] = np.sum(spatialdata[spatialdata['node'] == nodeid][ch])
-                else:
-                    sitedata[ch] = np.mean(spatialdata[spatialdata['node'] == nodeid][ch])
+            for c, ch in enumerate(self.spatial_channels):
+                sitedata[ch] = site_values[c, s]
 
             simdata.append(sitedata)
         simdata = pd.concat(simdata)
@@ -72,17 +95,15 @@ class ATSBAnalyzer(BaseAnalyzer):
                 simdata[sweep_var] = simulation.tags[sweep_var]
             else:
                 simdata[sweep_var] = 0
-        return simdata
+        return self.sink.write(simulation, simdata)
 
     def finalize(self, all_data):
 
-        selected = [data for sim, data in all_data.items()]
-        if len(selected) == 0:
+        manifest = self.sink.write_manifest()
+        if len(manifest['parts']) == 0:
             print("No data have been returned... Exiting...")
             return
-
-        df = pd.concat(selected).reset_index(drop=True)
-        df.to_csv(os.path.join(self.working_dir, '%s.csv' % self.expt_name), index=False)
+        print("%d simulations (%d new) in %s" % (len(manifest['parts']), len(all_data), self.sink.dataset_dir))
 
 
 if __name__ == "__main__":
@@ -90,7 +111,7 @@ if __name__ == "__main__":
     SetupParser.init("HPC")
     out_dir = os.path.join(projectdir, 'sim_data')
 
-    sites = pd.read_csv("site_details.csv")
+    sites = SiteRegistry()
 
     experiments = {
                    "atsb_llin_v2" :"31c65386-86e7-e811-a2bd-c4346bcb1555"
@@ -99,10 +120,11 @@ if __name__ == "__main__":
     for expt_name, exp_id in experiments.items():
         am = AnalyzeManager(exp_list=exp_id, analyzers=[ATSBAnalyzer(working_dir=out_dir,
                                                                      expt_name=expt_name,
-                                                                     report_names = sites["name"].tolist(),
+                                                                     report_names = sites.names,
                                                                       sweep_variables=["Run_Number",
                                                                                        "x_Temporary_Larval_Habitat",
-                                                                                       "intervention"
+                                                                                       "intervention",
+                                                                                       "CRN_Pair"
                                                                                        ])],
                             force_analyze=True)
 
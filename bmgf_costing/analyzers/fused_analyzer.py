@@ -0,0 +1,70 @@
+"""
+Runs several analyzers over the same simulations with a single read of their output files.
+
+The wrapped analyzers are handed to AnalyzeManager as one analyzer requesting the union of their files, unparsed. Each
+MalariaSummaryReport json is read once, only for the DataByTime channels any of the analyzers declared in summary_channels
+(see report_json), and every analyzer's select_simulation_data gets the same slimmed report. Analyzers that don't declare
+summary_channels get the whole report. Other files (e.g. InsetChart.json or SpatialReport bins) are passed on as raw
+bytes, which report_json and spatial_reports read as they would a file; json files are only decoded, once, for wrapped
+analyzers constructed with parse=True.
+"""
+
+import os
+import re
+import sys
+import json
+from simtools.Analysis.BaseAnalyzers import BaseAnalyzer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from report_json import summary_report
+
+SUMMARY_REPORT = re.compile(r'(^|/)MalariaSummaryReport_[^/]*\.json$')
+
+
+class FusedAnalyzer(BaseAnalyzer):
+
+    def __init__(self, analyzers, working_dir="."):
+        filenames = []
+        for analyzer in analyzers:
+            filenames += [f for f in analyzer.filenames if f not in filenames]
+        super(FusedAnalyzer, self).__init__(working_dir=working_dir, filenames=filenames, parse=False)
+        self.analyzers = analyzers
+
+        channels = [getattr(analyzer, 'summary_channels', None) for analyzer in analyzers]
+        self.summary_channels = None if None in channels else sorted(set(ch for chs in channels for ch in chs))
+
+    def initialize(self):
+        for analyzer in self.analyzers:
+            analyzer.initialize()
+
+    def per_experiment(self, experiment):
+        for analyzer in self.analyzers:
+            analyzer.per_experiment(experiment)
+
+    def filter(self, simulation):
+        return any(analyzer.filter(simulation) for analyzer in self.analyzers)
+
+    def parse_report(self, raw):
+        if self.summary_channels is None:
+            return json.loads(raw)
+        return summary_report(raw, self.summary_channels)
+
+    def select_simulation_data(self, data, simulation):
+        files = {fname: self.parse_report(raw) if SUMMARY_REPORT.search(fname) else raw for fname, raw in data.items()}
+        decoded = {}
+
+        def analyzer_file(analyzer, fname):
+            if not getattr(analyzer, 'parse', True) or not fname.endswith('.json') or SUMMARY_REPORT.search(fname):
+                return files[fname]
+            if fname not in decoded:
+                decoded[fname] = json.loads(files[fname])
+            return decoded[fname]
+
+        return [analyzer.select_simulation_data({fname: analyzer_file(analyzer, fname) for fname in analyzer.filenames},
+                                                simulation)
+                if analyzer.filter(simulation) else None
+                for analyzer in self.analyzers]
+
+    def finalize(self, all_data):
+        for a, analyzer in enumerate(self.analyzers):
+            analyzer.finalize({sim: results[a] for sim, results in all_data.items() if results[a] is not None})
@@ -6,11 +6,16 @@ Nov 2018
 """
 
 import os
+import sys
 import pandas as pd
 import numpy as np
 from simtools.Analysis.AnalyzeManager import AnalyzeManager
 from simtools.Analysis.BaseAnalyzers import BaseAnalyzer
 from simtools.SetupParser import SetupParser
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from site_registry import SiteRegistry
+from report_json import summary_report
+from result_sink import ResultSink
 
 
 projectdir = os.path.join('E:/', 'Dropbox (IDM)', 'Malaria Team Folder', 'projects', 'atsb')
@@ -21,18 +26,26 @@ class PrevalenceAnalyzer(BaseAnalyzer):
     def __init__(self, expt_name, report_names=["AnnualAverage"], sweep_variables=None, working_dir="."):
         super(PrevalenceAnalyzer, self).__init__(working_dir=working_dir,
                                         filenames=["output/MalariaSummaryReport_{name}.json".format(name=name)
-                                                      for name in report_names]
+                                                      for name in report_names],
+                                                 parse=False
                                            )
         self.sweep_variables = sweep_variables or ["Run_Number"]
         self.sitenames=report_names
         self.expt_name = expt_name
-        self.reference = pd.read_csv('site_details.csv')
+        self.summary_channels = ['PfPR_2to10']
+        self.sink = ResultSink(os.path.join(working_dir, '%s_PfPR' % expt_name))
+
+    def filter(self, simulation):
+        # simulations already written by an earlier (interrupted) run are not fetched again
+        return not self.sink.done(simulation)
 
     def select_simulation_data(self, data, simulation):
         simdata = []
         for site_name in self.sitenames:
 
-            channeldata = data["output/MalariaSummaryReport_{name}.json".format(name=site_name)]["DataByTime"]["PfPR_2to10"]
+            report = summary_report(data["output/MalariaSummaryReport_{name}.json".format(name=site_name)],
+                                    self.summary_channels)
+            channeldata = report["DataByTime"]["PfPR_2to10"]
 
             sitedata = pd.DataFrame({'PfPR2to10': channeldata,
                                     "Site_Name": site_name})
@@ -46,17 +59,15 @@ class PrevalenceAnalyzer(BaseAnalyzer):
                 simdata[sweep_var] = simulation.tags[sweep_var]
             else:
                 simdata[sweep_var] = 0
-        return simdata
+        return self.sink.write(simulation, simdata)
 
     def finalize(self, all_data):
 
-        selected = [data for sim, data in all_data.items()]
-        if len(selected) == 0:
+        manifest = self.sink.write_manifest()
+        if len(manifest['parts']) == 0:
             print("No data have been returned... Exiting...")
             return
-
-        df = pd.concat(selected).reset_index(drop=True)
-        df.to_csv(os.path.join(self.working_dir, '%s_PfPR.csv' % self.expt_name), index=False)
+        print("%d simulations (%d new) in %s" % (len(manifest['parts']), len(all_data), self.sink.dataset_dir))
 
 
 if __name__ == "__main__":
@@ -66,7 +77,7 @@ if __name__ == "__main__":
 
     out_dir = os.path.join(projectdir, 'sim_data')
 
-    sites = pd.read_csv("site_details.csv")
+    sites = SiteRegistry()
 
     experiments = {
                    "atsb_llin_v2" :"31c65386-86e7-e811-a2bd-c4346bcb1555"
@@ -75,7 +86,7 @@ if __name__ == "__main__":
     for expt_name, exp_id in experiments.items():
         am = AnalyzeManager(exp_list=exp_id, analyzers=[PrevalenceAnalyzer(working_dir=out_dir,
                                                                      expt_name=expt_name,
-                                                                     report_names = sites["name"].tolist(),
+                                                                     report_names = sites.names,
                                                                       sweep_variables=["Run_Number",
                                                                                        "x_Temporary_Larval_Habitat",
                                                                                        "intervention"
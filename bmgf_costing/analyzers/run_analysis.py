@@ -1,34 +1,44 @@
 import os
 import sys
-import pandas as pd
 sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
 from simtools.Analysis.AnalyzeManager import AnalyzeManager
 from prevalence_reduction_analyzer import PrevalenceAnalyzer
 from atsb_llin_impact_analyzer import ATSBAnalyzer
+from fused_analyzer import FusedAnalyzer
+from site_registry import SiteRegistry
+
+# read the SpatialReports' sites and time window straight from the simulation directories; only set this when they are
+# reachable from here (a local run or on the HPC), otherwise the reports are fetched from COMPS as usual
+SPATIAL_FROM_DISK = False
 
 if __name__ == "__main__":
 
-    sites = pd.read_csv("site_details.csv")
+    sites = SiteRegistry()
 
     experiments = {
                    "atsb_llin_HS_v2" :"285429ad-9d03-e911-a2bd-c4346bcb1555"
                    }
 
     for expt_name, exp_id in experiments.items():
-        am = AnalyzeManager(exp_list=exp_id, analyzers=[PrevalenceAnalyzer(expt_name=expt_name,
-                                                                     report_names = sites["name"].tolist(),
-                                                                      sweep_variables=["Run_Number",
-                                                                                       "x_Temporary_Larval_Habitat",
-                                                                                       "intervention"
-                                                                                       ]),
-                                                        ATSBAnalyzer(expt_name=expt_name,
-                                                                     report_names=sites["name"].tolist(),
-                                                                     sweep_variables=["Run_Number",
-                                                                                      "x_Temporary_Larval_Habitat",
-                                                                                      "intervention"
-                                                                                      ])
-                                                        ],
-                            force_analyze=True)
+        # both analyzers read the same summary reports; the fused analyzer parses each one once for the two of them
+        analyzers = [PrevalenceAnalyzer(expt_name=expt_name,
+                                        report_names=sites.names,
+                                        sweep_variables=["Run_Number",
+                                                         "x_Temporary_Larval_Habitat",
+                                                         "intervention",
+                                                         "CRN_Pair"
+                                                         ]),
+                     ATSBAnalyzer(expt_name=expt_name,
+                                  report_names=sites.names,
+                                  sweep_variables=["Run_Number",
+                                                   "x_Temporary_Larval_Habitat",
+                                                   "intervention",
+                                                   "CRN_Pair"
+                                                   ],
+                                  spatial_from_disk=SPATIAL_FROM_DISK)
+                     ]
+        am = AnalyzeManager(exp_list=exp_id, analyzers=[FusedAnalyzer(analyzers)], force_analyze=True)
 
     am.analyze()
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+ATSB killing configs for add_ATSB from a species x waning class x parameter table.
+
+A table has one row per species with a 'class' column (full WaningEffect class name or its short form, e.g. 'Constant',
+'BoxExponential', 'MapLinearSeasonal', 'MapPiecewise') and one column per waning parameter: Initial_Effect,
+Box_Duration, Decay_Time_Constant, and Times/Values for the Durability_Map of the map classes. Parameters a class doesn't
+use are ignored. Configs are memoized on their parameter values as immutable tuples, so a sweep that repeats a killing
+value across seeds and habitats validates each parameter set once; every caller still gets its own WaningEffect dict,
+which it is free to modify.
+"""
+
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+WANING_PARAMS = {'WaningEffectConstant': ['Initial_Effect'],
+                 'WaningEffectExponential': ['Initial_Effect', 'Decay_Time_Constant'],
+                 'WaningEffectBox': ['Initial_Effect', 'Box_Duration'],
+                 'WaningEffectBoxExponential': ['Initial_Effect', 'Box_Duration', 'Decay_Time_Constant'],
+                 'WaningEffectMapLinearSeasonal': ['Initial_Effect', 'Times', 'Values'],
+                 'WaningEffectMapPiecewise': ['Initial_Effect', 'Times', 'Values'],
+                 'WaningEffectMapLinear': ['Initial_Effect', 'Times', 'Values']}
+
+PARAM_COLUMNS = ['Initial_Effect', 'Box_Duration', 'Decay_Time_Constant', 'Times', 'Values']
+
+
+def waning_class(name):
+    """
+    'Constant' -> 'WaningEffectConstant'; full class names are returned unchanged
+    """
+    cls = name if name.startswith('WaningEffect') else 'WaningEffect' + name
+    if cls not in WANING_PARAMS:
+        raise ValueError('Unknown waning class %s; expected one of %s' % (name, sorted(WANING_PARAMS)))
+    return cls
+
+
+def _as_tuple(value):
+    if value is None or (np.isscalar(value) and pd.isnull(value)):
+        return None
+    if isinstance(value, str):
+        return tuple(float(x) for x in value.split(';'))
+    return tuple(float(x) for x in np.ravel(value))
+
+
+@lru_cache(maxsize=None)
+def _frozen_waning_config(cls, initial_effect, box_duration, decay_time_constant, times, values):
+    config = [('class', cls), ('Initial_Effect', initial_effect)]
+    if 'Box_Duration' in WANING_PARAMS[cls]:
+        config.append(('Box_Duration', box_duration))
+    if 'Decay_Time_Constant' in WANING_PARAMS[cls]:
+        config.append(('Decay_Time_Constant', decay_time_constant))
+    if 'Times' in WANING_PARAMS[cls]:
+        config.append(('Durability_Map', (('Times', times), ('Values', values))))
+    return tuple(config)
+
+
+def _waning_config(*params):
+    # a new dict (and Durability_Map lists) per call, so no two campaign events share a mutable config
+    return {k: {mk: list(mv) for mk, mv in v} if k == 'Durability_Map' else v
+            for k, v in _frozen_waning_config(*params)}
+
+
+def waning_config(cls, Initial_Effect, Box_Duration=None, Decay_Time_Constant=None, Times=None, Values=None):
+    """
+    WaningEffect dict for one parameter set
+    """
+    return kill_configs(killing_table(['_'], cls, Initial_Effect=Initial_Effect, Box_Duration=Box_Duration,
+                                      Decay_Time_Constant=Decay_Time_Constant, Times=Times,
+                                      Values=Values))[0]['Killing_Config']
+
+
+def killing_table(species, cls='Constant', **params):
+    """
+    Build a killing table with one row per species
+    :param species: species names
+    :param cls: waning class for every species, or one per species
+    :param params: waning parameters (see PARAM_COLUMNS), each a single value for every species or one per species;
+    Times/Values are lists, or one list per species
+    :return: pandas.DataFrame with Species, class and parameter columns
+    """
+    species = list(species)
+    df = pd.DataFrame({'Species': species})
+    df['class'] = [cls] * len(species) if isinstance(cls, str) else list(cls)
+    for column in PARAM_COLUMNS:
+        value = params.pop(column, None)
+        per_species = (isinstance(value, (list, tuple, np.ndarray, pd.Series)) and len(value) == len(species)
+                       and (column not in ('Times', 'Values') or np.ndim(value[0]) == 1 or isinstance(value[0], str)))
+        df[column] = list(value) if per_species else [value] * len(species)
+    if params:
+        raise ValueError('Unknown waning parameters %s; expected %s' % (sorted(params), PARAM_COLUMNS))
+    return df
+
+
+def kill_configs(table):
+    """
+    kill_cfg list for add_ATSB
+    :param table: killing table (see killing_table or the module docstring)
+    :return: list of {'Species': species, 'Killing_Config': WaningEffect dict}
+    """
+    table = table.reindex(columns=['Species', 'class'] + PARAM_COLUMNS)
+    classes = table['class'].map(waning_class)
+
+    # each class must have all of its parameters
+    for cls, cdf in table.groupby(classes, sort=False):
+        missing = [p for p in WANING_PARAMS[cls] if cdf[p].isnull().any()]
+        if missing:
+            raise ValueError('%s needs %s for species %s' % (cls, missing, cdf['Species'].tolist()))
+
+    def number(x):
+        return None if pd.isnull(x) else float(x)
+
+    return [{'Species': sp,
+             'Killing_Config': _waning_config(cls, number(ie), number(box), number(decay), _as_tuple(times),
+                                              _as_tuple(values))}
+            for sp, cls, ie, box, decay, times, values in zip(table['Species'], classes, table['Initial_Effect'],
+                                                               table['Box_Duration'], table['Decay_Time_Constant'],
+                                                               table['Times'], table['Values'])]
+
+
+def kill_config_sweep(species, killings, cls='Constant', **params):
+    """
+    kill_cfg lists for a sweep over Initial_Effect with the other parameters fixed
+    :return: dict of Initial_Effect to kill_cfg list
+    """
+    return {killing: kill_configs(killing_table(species, cls, Initial_Effect=killing, **params))
+            for killing in killings}
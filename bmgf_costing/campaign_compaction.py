@@ -0,0 +1,109 @@
+"""
+Compaction of campaign events built by the sweep_functions helpers.
+
+add_annual_itns and add_irs_group emit one full campaign event per year, identical apart from Start_Day, so campaign.json
+and its parse time grow with the simulated years. compact_events merges each run of such events whose start days are
+evenly spaced into a single event using the coordinator's Number_Repetitions and Timesteps_Between_Repetitions.
+
+Only events whose coordinator supports repetitions and doesn't already repeat are merged. Events sharing a start day are
+never merged with each other, since two identical distributions on the same day are not the same as one.
+"""
+
+import copy
+import json
+
+REPEATABLE_COORDINATORS = {'StandardInterventionDistributionEventCoordinator'}
+
+
+def _event_dict(event):
+    if isinstance(event, dict):
+        return copy.deepcopy(event)
+    if hasattr(event, 'to_json'):
+        return json.loads(event.to_json())
+    raise TypeError('Cannot compact campaign event of type %s' % type(event).__name__)
+
+
+def _size(events):
+    return len(json.dumps(events, sort_keys=True))
+
+
+def _repeatable(event):
+    coordinator = event.get('Event_Coordinator_Config', {})
+    return (event.get('class', 'CampaignEvent') == 'CampaignEvent'
+            and coordinator.get('class') in REPEATABLE_COORDINATORS
+            and coordinator.get('Number_Repetitions', 1) == 1)
+
+
+def _progressions(days):
+    """
+    Split sorted, distinct start days into runs with a constant step
+    :return: list of (first day, count, step)
+    """
+    runs = []
+    i = 0
+    while i < len(days):
+        if i + 1 == len(days):
+            runs.append((days[i], 1, 0))
+            break
+        step = days[i + 1] - days[i]
+        j = i + 1
+        while j + 1 < len(days) and days[j + 1] - days[j] == step:
+            j += 1
+        runs.append((days[i], j - i + 1, step))
+        i = j + 1
+    return runs
+
+
+def compact_events(events):
+    """
+    :param events: campaign events (dicts or campaign class objects) in campaign order
+    :return: (compacted list of event dicts, dict with event counts and JSON sizes)
+    """
+    events = [_event_dict(event) for event in events]
+    size_before = _size(events)
+
+    groups = {}  # event without Start_Day -> [position of first occurrence, start days]
+    compacted = []
+    for event in events:
+        if not _repeatable(event) or 'Start_Day' not in event:
+            compacted.append(event)
+            continue
+        key = json.dumps({k: v for k, v in event.items() if k != 'Start_Day'}, sort_keys=True)
+        if key not in groups:
+            groups[key] = [len(compacted), []]
+            compacted.append(None)
+        groups[key][1].append(event['Start_Day'])
+
+    merged = {}
+    for key, (position, days) in groups.items():
+        template = json.loads(key)
+        unique_days = sorted(set(days))
+        # same-day duplicates are kept as separate events
+        extra_days = [d for d in unique_days for _ in range(days.count(d) - 1)]
+        merged[position] = []
+        for start, count, step in _progressions(unique_days):
+            event = dict(copy.deepcopy(template), Start_Day=start)
+            if count > 1:
+                event['Event_Coordinator_Config']['Number_Repetitions'] = count
+                event['Event_Coordinator_Config']['Timesteps_Between_Repetitions'] = step
+            merged[position].append(event)
+        merged[position] += [dict(copy.deepcopy(template), Start_Day=d) for d in extra_days]
+
+    compacted = [e for i, event in enumerate(compacted)
+                 for e in (merged[i] if event is None else [event])]
+
+    report = {'events_before': len(events), 'events_after': len(compacted),
+              'bytes_before': size_before, 'bytes_after': _size(compacted)}
+    return compacted, report
+
+
+def compact_campaign(cb, verbose=True):
+    """
+    Compact the events of a config builder's campaign in place
+    :return: the size report of compact_events
+    """
+    cb.campaign.Events, report = compact_events(cb.campaign.Events)
+    if verbose:
+        print('campaign compacted from %(events_before)d to %(events_after)d events, '
+              '%(bytes_before)d to %(bytes_after)d bytes' % report)
+    return report
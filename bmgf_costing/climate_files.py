@@ -0,0 +1,272 @@
+"""
+Read access to DTK climate inputs (e.g. sites/all/air_temperature_daily.bin and its .bin.json header) without going
+through the simulator.
+
+A climate .bin is a flat array of little-endian float32 values, one block of DatavalueCount values per node. The
+NodeOffsets string in the .bin.json header holds 16 hex digits per node: the NodeID followed by the byte offset of that
+node's block in the .bin. Files are memory-mapped and per-node series are returned as views, so nothing is read from
+disk until the values are actually used.
+"""
+
+import os
+import re
+import json
+import datetime
+import numpy as np
+import pandas as pd
+
+CLIMATE_DTYPE = np.dtype('<f4')
+
+CLIMATE_FILENAMES = {'air_temperature': 'air_temperature_daily.bin',
+                     'rainfall': 'rainfall_daily.bin',
+                     'relative_humidity': 'relative_humidity_daily.bin'}
+
+
+def decode_node_offsets(node_offsets):
+    """
+    Decode the NodeOffsets hex string of a climate header
+    :param node_offsets: NodeOffsets string from a .bin.json
+    :return: (node_ids, byte_offsets) numpy arrays in file order
+    """
+    pairs = np.frombuffer(bytes.fromhex(node_offsets), dtype='>u4').reshape(-1, 2)
+    return pairs[:, 0].astype(np.int64), pairs[:, 1].astype(np.int64)
+
+
+class ClimateFile:
+
+    def __init__(self, bin_fname):
+        with open(bin_fname + '.json') as f:
+            header = json.load(f)
+        self.fname = bin_fname
+        self.metadata = header['Metadata']
+        self.node_ids, self.offsets = decode_node_offsets(header['NodeOffsets'])
+        self.num_values = int(self.metadata['DatavalueCount'])
+
+        if len(self.node_ids) != int(self.metadata['NodeCount']):
+            raise ValueError('%s: NodeOffsets lists %d nodes but NodeCount is %s'
+                             % (bin_fname, len(self.node_ids), self.metadata['NodeCount']))
+        if len(self.node_ids) and self.offsets.max() + self.num_values * CLIMATE_DTYPE.itemsize > os.path.getsize(bin_fname):
+            raise ValueError('%s is shorter than its NodeOffsets imply' % bin_fname)
+
+        self.data = np.memmap(bin_fname, dtype=CLIMATE_DTYPE, mode='r')
+        self._rows = {node_id: i for i, node_id in enumerate(self.node_ids.tolist())}
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def __contains__(self, node_id):
+        return int(node_id) in self._rows
+
+    def __getitem__(self, node_id):
+        """
+        :param node_id: DTK NodeID
+        :return: read-only view of the node's DatavalueCount values
+        """
+        try:
+            start = self.offsets[self._rows[int(node_id)]] // CLIMATE_DTYPE.itemsize
+        except KeyError:
+            raise KeyError('Node %s not in %s' % (node_id, self.fname))
+        return self.data[start:start + self.num_values]
+
+    def is_packed(self):
+        """
+        True when node blocks are stored back to back in NodeOffsets order, i.e. the whole file is a (node x time) array
+        """
+        expected = np.arange(len(self.node_ids)) * self.num_values * CLIMATE_DTYPE.itemsize
+        return bool(np.array_equal(self.offsets, expected))
+
+    def values(self, node_ids=None):
+        """
+        (node x time) array of climate values
+        :param node_ids: optional list of NodeIDs; defaults to all nodes in file order
+        :return: a view into the mmap for all nodes of a packed file, otherwise a copy of the requested rows only
+        """
+        if node_ids is None:
+            if self.is_packed():
+                return self.data[:len(self.node_ids) * self.num_values].reshape(len(self.node_ids), self.num_values)
+            node_ids = self.node_ids
+        if len(node_ids) == 0:
+            return np.empty((0, self.num_values), dtype=CLIMATE_DTYPE)
+        return np.stack([self[node_id] for node_id in node_ids])
+
+
+def open_site_climate(site_input_dir, channels=None):
+    """
+    Memory-map the climate files of a site input directory
+    :param site_input_dir: directory holding the climate .bin/.bin.json pairs, e.g. sites/all
+    :param channels: subset of CLIMATE_FILENAMES keys; defaults to all
+    :return: dict of channel name to ClimateFile
+    """
+    channels = channels or list(CLIMATE_FILENAMES.keys())
+    return {ch: ClimateFile(os.path.join(site_input_dir, CLIMATE_FILENAMES[ch])) for ch in channels}
+
+
+def site_climate_df(site_input_dir, node_id, channels=None):
+    """
+    Daily climate for a single node, e.g. for seasonality plots
+    :return: pandas.DataFrame with one column per channel and a 'day' column
+    """
+    climate = open_site_climate(site_input_dir, channels)
+    df = pd.DataFrame({ch: np.asarray(cf[node_id]) for ch, cf in climate.items()})
+    df['day'] = df.index
+    return df
+
+
+def encode_node_offsets(node_ids, byte_offsets):
+    """
+    Inverse of decode_node_offsets
+    :return: NodeOffsets hex string
+    """
+    pairs = np.stack([np.asarray(node_ids, dtype=np.int64), np.asarray(byte_offsets, dtype=np.int64)], axis=1)
+    return pairs.astype('>u4').tobytes().hex().upper()
+
+
+PROVENANCE_KEYS = ['OriginalDataYears', 'StartDayOfYear', 'DataProvenance', 'DateCreated']
+
+
+def _derived_provenance(source, num_values, update_resolution):
+    """
+    Provenance entries for a series derived from the one described by source, when it covers a different number of
+    values or has another UpdateResolution; empty when the source's entries still hold
+    """
+    if update_resolution == source.get('UpdateResolution', 'CLIMATE_UPDATE_DAY') and \
+            num_values == source.get('DatavalueCount', num_values):
+        return {}
+
+    provenance = {'DateCreated': datetime.datetime.now().isoformat()}
+    original_years = source.get('OriginalDataYears')
+    steps = STEPS_PER_YEAR[update_resolution]
+    if num_values % steps == 0:
+        # whole years: the series still starts on the source's first day and year
+        years = re.match(r'\s*(\d+)\s*-\s*\d+\s*$', str(original_years or ''))
+        if years:
+            first = int(years.group(1))
+            provenance['OriginalDataYears'] = '%d-%d' % (first, first + num_values // steps - 1)
+        if 'StartDayOfYear' in source:
+            provenance['StartDayOfYear'] = source['StartDayOfYear']
+    provenance['DataProvenance'] = '%d values at %s derived from %s' % (
+        num_values, update_resolution, 'years %s' % original_years if original_years else 'an existing climate file')
+    if source.get('DataProvenance'):
+        provenance['DataProvenance'] += ' (%s)' % source['DataProvenance']
+    return provenance
+
+
+def write_climate_file(bin_fname, node_ids, values, metadata=None, update_resolution=None, carry_over=None):
+    """
+    Write a climate .bin/.bin.json pair with node blocks stored back to back
+    :param bin_fname: output .bin path; the header goes to bin_fname + '.json'
+    :param node_ids: NodeIDs, one per row of values
+    :param values: (node x time) array
+    :param metadata: header Metadata of the source (e.g. ClimateFile.metadata); node and value counts are always
+    recomputed
+    :param update_resolution: UpdateResolution of values; defaults to the one in metadata, else CLIMATE_UPDATE_DAY
+    :param carry_over: metadata keys to copy unchanged; by default all of them, except that the PROVENANCE_KEYS are
+    rewritten (or dropped) when values no longer have the source's length or UpdateResolution
+    """
+    values = np.ascontiguousarray(values, dtype=CLIMATE_DTYPE)
+    if values.ndim != 2 or values.shape[0] != len(node_ids):
+        raise ValueError('Expected a (node x time) array with %d rows, got shape %s' % (len(node_ids), values.shape))
+
+    num_nodes, num_values = values.shape
+    source = dict(metadata or {})
+    update_resolution = update_resolution or source.get('UpdateResolution', 'CLIMATE_UPDATE_DAY')
+    if update_resolution not in STEPS_PER_YEAR:
+        raise ValueError('Unknown UpdateResolution %s' % update_resolution)
+    if carry_over is None:
+        provenance = _derived_provenance(source, num_values, update_resolution)
+        metadata = {k: v for k, v in source.items() if not provenance or k not in PROVENANCE_KEYS}
+        metadata.update(provenance)
+    else:
+        metadata = {k: source[k] for k in carry_over if k in source}
+    metadata.update({'NodeCount': num_nodes,
+                     'WeatherCellCount': num_nodes,
+                     'OffsetEntryCount': num_nodes,
+                     'NumberDTKNodes': num_nodes,
+                     'DatavaluePerCell': num_values,
+                     'DatavalueCount': num_values})
+    metadata['UpdateResolution'] = update_resolution
+    offsets = np.arange(num_nodes) * num_values * CLIMATE_DTYPE.itemsize
+
+    values.tofile(bin_fname)
+    with open(bin_fname + '.json', 'w') as f:
+        json.dump({'Metadata': metadata,
+                   'NodeOffsets': encode_node_offsets(node_ids, offsets)}, f, indent=2)
+
+
+STEPS_PER_YEAR = {'CLIMATE_UPDATE_YEAR': 1,
+                  'CLIMATE_UPDATE_MONTH': 12,
+                  'CLIMATE_UPDATE_WEEK': 52,
+                  'CLIMATE_UPDATE_DAY': 365,
+                  'CLIMATE_UPDATE_HOUR': 365 * 24}
+
+MONTH_START_DAYS = np.cumsum([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30])
+
+
+def _bin_starts(from_steps, to_steps):
+    if (from_steps, to_steps) == (365, 12):
+        return MONTH_START_DAYS
+    return (np.arange(to_steps) * from_steps) // to_steps
+
+
+def resample_climate(values, from_resolution, to_resolution):
+    """
+    Change the UpdateResolution of (node x time) climate values covering whole years. Coarsening averages the values in
+    each new period; refining holds each value over the finer steps it covers, as the model does between updates.
+    :param values: (node x time) array, e.g. ClimateFile.values()
+    :param from_resolution: UpdateResolution of values, e.g. 'CLIMATE_UPDATE_DAY'
+    :param to_resolution: target UpdateResolution, e.g. 'CLIMATE_UPDATE_MONTH'
+    :return: (node x new time) float32 array
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=CLIMATE_DTYPE))
+    from_steps, to_steps = STEPS_PER_YEAR[from_resolution], STEPS_PER_YEAR[to_resolution]
+    if values.shape[1] % from_steps:
+        raise ValueError('%d values is not a whole number of years at %s' % (values.shape[1], from_resolution))
+    if from_steps == to_steps:
+        return values
+
+    num_years = values.shape[1] // from_steps
+    by_year = values.reshape(values.shape[0] * num_years, from_steps)
+    if to_steps < from_steps:
+        starts = _bin_starts(from_steps, to_steps)
+        sums = np.add.reduceat(by_year, starts, axis=1)
+        resampled = sums / np.diff(np.append(starts, from_steps))
+    else:
+        resampled = by_year[:, np.searchsorted(_bin_starts(to_steps, from_steps), np.arange(to_steps), side='right') - 1]
+    return resampled.reshape(values.shape[0], num_years * to_steps).astype(CLIMATE_DTYPE)
+
+
+def concatenate_years(yearly_values):
+    """
+    Join per-year (node x time) arrays into one multi-year series, e.g. to build a 12-year climate cycle
+    :param yearly_values: list of arrays with matching node rows, in year order
+    """
+    return np.concatenate([np.atleast_2d(np.asarray(v, dtype=CLIMATE_DTYPE)) for v in yearly_values], axis=1)
+
+
+def tile_years(values, num_years):
+    """
+    Repeat a (node x time) series num_years times along time
+    """
+    return np.tile(np.atleast_2d(np.asarray(values, dtype=CLIMATE_DTYPE)), (1, num_years))
+
+
+def build_climate_files(in_dir, out_dir, num_years=1, update_resolution=None, node_ids=None, channels=None):
+    """
+    Derive a new set of climate files from existing ones in one pass per channel, e.g. turning the single-year
+    sites/all files into a multi-year cycle or a subset of nodes
+    :param in_dir: directory with the source .bin/.bin.json pairs
+    :param out_dir: output directory; file names are kept
+    :param num_years: number of times the source series is repeated
+    :param update_resolution: target UpdateResolution; defaults to the source's
+    :param node_ids: NodeIDs to keep; defaults to all
+    :param channels: subset of CLIMATE_FILENAMES keys; defaults to all
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for ch, cf in open_site_climate(in_dir, channels).items():
+        node_ids_out = cf.node_ids if node_ids is None else np.asarray(node_ids)
+        values = cf.values(None if node_ids is None else node_ids_out)
+        from_resolution = cf.metadata.get('UpdateResolution', 'CLIMATE_UPDATE_DAY')
+        if update_resolution:
+            values = resample_climate(values, from_resolution, update_resolution)
+        write_climate_file(os.path.join(out_dir, CLIMATE_FILENAMES[ch]), node_ids_out, tile_years(values, num_years),
+                           cf.metadata, update_resolution=update_resolution)
@@ -0,0 +1,305 @@
+"""
+Lazy access to large DTK demographics files (e.g. sites/all/demographics.json).
+
+Each node carries its full MortalityDistribution/AgeDistribution tables inline, so parsing the whole document to check a
+few NodeAttributes gets expensive as the node count grows. DemographicsFile scans the raw bytes once to find the byte
+range of every node and of each block inside it (NodeAttributes, IndividualAttributes, ...), keeps that index in a
+sidecar file next to the demographics file, and afterwards json-decodes only the slices that are asked for.
+"""
+
+import os
+import re
+import json
+import mmap
+import datetime
+import numpy as np
+import pandas as pd
+
+INDEX_VERSION = 1
+
+# strings (with escapes) and the structural characters we need to track nesting and key/value boundaries
+_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\],:]')
+
+
+def scan_demographics(buf):
+    """
+    Find the byte ranges of the top-level blocks, of each node, and of the blocks within each node
+    :param buf: bytes-like contents of a demographics file
+    :return: ({key: [start, end]} for the root object, [{'range': [start, end], 'blocks': {key: [start, end]}}])
+    """
+    top_blocks = {}
+    nodes = []
+    stack = []
+    pairs = {}  # depth -> [key, value start] of the key/value pair being read at that depth
+    expect_key = False
+    node = None
+
+    for m in _TOKEN.finditer(buf):
+        tok = m.group()
+        c = tok[:1]
+        depth = len(stack)
+
+        if c == b'"':
+            if expect_key:
+                pairs[depth] = [json.loads(tok), None]
+                expect_key = False
+        elif c == b':':
+            pairs[depth][1] = m.end()
+        elif c == b'{' or c == b'[':
+            if depth == 2 and c == b'{' and pairs.get(1, [None])[0] == 'Nodes':
+                node = {'range': [m.start(), None], 'blocks': {}}
+            stack.append(c)
+            expect_key = c == b'{'
+        else:
+            # ',', '}' or ']' ends the pair being read at this depth
+            if depth in pairs:
+                key, start = pairs.pop(depth)
+                if depth == 1:
+                    top_blocks[key] = [_skip_ws(buf, start), _strip_ws(buf, m.start())]
+                elif depth == 3 and node is not None:
+                    node['blocks'][key] = [_skip_ws(buf, start), _strip_ws(buf, m.start())]
+            if c == b',':
+                expect_key = stack[-1] == b'{'
+            else:
+                stack.pop()
+                if node is not None and len(stack) == 2:
+                    node['range'][1] = m.end()
+                    nodes.append(node)
+                    node = None
+    return top_blocks, nodes
+
+
+def _skip_ws(buf, pos):
+    while buf[pos:pos + 1].isspace():
+        pos += 1
+    return pos
+
+
+def _strip_ws(buf, pos):
+    while pos > 0 and buf[pos - 1:pos].isspace():
+        pos -= 1
+    return pos
+
+
+class DemographicsFile:
+
+    def __init__(self, fname, cache_index=True):
+        """
+        :param cache_index: reuse, or write, the <fname>.index.json sidecar; False scans the file without touching its
+        directory, e.g. when only checking the inputs
+        """
+        self.fname = fname
+        self.index_fname = fname + '.index.json'
+        with open(fname, 'rb') as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        stat = os.stat(fname)
+        signature = {'version': INDEX_VERSION, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        index = self._load_index(signature) if cache_index else None
+        if index is None:
+            top_blocks, nodes = scan_demographics(self._buf)
+            index = dict(signature, top_blocks=top_blocks,
+                         nodes={str(self._decode(n['blocks']['NodeID'])): n for n in nodes})
+            if cache_index:
+                with open(self.index_fname, 'w') as f:
+                    json.dump(index, f)
+
+        self.top_blocks = index['top_blocks']
+        self._nodes = {int(node_id): n for node_id, n in index['nodes'].items()}
+        self.node_ids = list(self._nodes.keys())
+
+    def _load_index(self, signature):
+        try:
+            with open(self.index_fname) as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if any(index.get(k) != v for k, v in signature.items()):
+            return None
+        return index
+
+    def _decode(self, byte_range):
+        return json.loads(self._buf[byte_range[0]:byte_range[1]])
+
+    def close(self):
+        self._buf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def __contains__(self, node_id):
+        return int(node_id) in self._nodes
+
+    def block(self, name):
+        """
+        Decode a top-level block, e.g. 'Defaults' or 'Metadata'
+        """
+        return self._decode(self.top_blocks[name]) if name in self.top_blocks else None
+
+    def node(self, node_id, blocks=None):
+        """
+        Decode one node
+        :param node_id: DTK NodeID
+        :param blocks: node-level keys to decode (e.g. ['NodeAttributes']); defaults to the whole node
+        :return: dict
+        """
+        try:
+            entry = self._nodes[int(node_id)]
+        except KeyError:
+            raise KeyError('Node %s not in %s' % (node_id, self.fname))
+        if blocks is None:
+            return self._decode(entry['range'])
+        node = {'NodeID': int(node_id)}
+        node.update({b: self._decode(entry['blocks'][b]) for b in blocks if b in entry['blocks']})
+        return node
+
+    def node_attributes(self, attributes=None, node_ids=None):
+        """
+        Table of NodeAttributes without decoding any IndividualAttributes
+        :param attributes: NodeAttributes keys to keep, e.g. ['InitialPopulation', 'BirthRate'];
+        defaults to all of them
+        :param node_ids: subset of NodeIDs; defaults to all nodes in file order
+        :return: pandas.DataFrame indexed by NodeID
+        """
+        node_ids = self.node_ids if node_ids is None else [int(x) for x in node_ids]
+        rows = []
+        for node_id in node_ids:
+            attrs = self.node(node_id, ['NodeAttributes']).get('NodeAttributes', {})
+            if attributes is not None:
+                attrs = {a: attrs.get(a) for a in attributes}
+            rows.append(attrs)
+        return pd.DataFrame(rows, index=pd.Index(node_ids, name='NodeID'))
+
+    def vectors_per_species(self, node_ids=None):
+        """
+        InitialVectorsPerSpecies as a (node x species) table
+        """
+        df = self.node_attributes(['InitialVectorsPerSpecies'], node_ids)
+        return pd.DataFrame(df['InitialVectorsPerSpecies'].tolist(), index=df.index).fillna(0)
+
+
+def ip_table(property_name, values, distribution, node_ids=None):
+    """
+    Long-form IndividualProperties table for one property, as consumed by generate_ip_overlay
+    :param property_name: e.g. 'NetUsage'
+    :param values: property values, e.g. ['HatesNets', 'LovesNets']
+    :param distribution: Initial_Distribution over values; a (nodes x values) array when node_ids are given
+    :param node_ids: NodeIDs for per-node distributions; None for a Defaults entry
+    :return: pandas.DataFrame with node_id, Property, Value and Initial_Distribution columns
+    """
+    distribution = np.atleast_2d(np.asarray(distribution, dtype=float))
+    num_nodes = 1 if node_ids is None else len(node_ids)
+    if distribution.shape == (1, len(values)) and num_nodes > 1:
+        distribution = np.repeat(distribution, num_nodes, axis=0)
+    if distribution.shape != (num_nodes, len(values)):
+        raise ValueError('Expected an Initial_Distribution of shape %s, got %s'
+                         % ((num_nodes, len(values)), distribution.shape))
+
+    return pd.DataFrame({'node_id': np.repeat(np.nan if node_ids is None else np.asarray(node_ids, dtype=float),
+                                              len(values)),
+                         'Property': property_name,
+                         'Value': np.tile(values, num_nodes),
+                         'Initial_Distribution': distribution.ravel()})
+
+
+def validate_ip_table(df, node_ids=None, tolerance=1e-6):
+    """
+    Check a long-form IndividualProperties table (see ip_table) before it is written
+    :param df: table with node_id (NaN for Defaults), Property, Value and Initial_Distribution columns
+    :param node_ids: NodeIDs present in the demographics file the overlay applies to
+    :return: list of problems; empty when the table is valid
+    """
+    errors = []
+    missing = {'node_id', 'Property', 'Value', 'Initial_Distribution'} - set(df.columns)
+    if missing:
+        return ['IP table is missing columns %s' % sorted(missing)]
+
+    keys = df['node_id'].fillna(-1)
+    if (df['Initial_Distribution'] < 0).any():
+        errors.append('Negative Initial_Distribution for %s' % sorted(df.loc[df['Initial_Distribution'] < 0,
+                                                                           'Property'].unique()))
+    dupes = df[pd.concat([keys, df[['Property', 'Value']]], axis=1).duplicated()]
+    if len(dupes):
+        errors.append('Duplicate values %s' % dupes[['node_id', 'Property', 'Value']].values.tolist())
+
+    sums = df.groupby([keys, df['Property']])['Initial_Distribution'].sum()
+    bad = sums[(sums - 1).abs() > tolerance]
+    if len(bad):
+        errors.append('Initial_Distribution does not sum to 1 for (node_id, Property) %s'
+                      % [(None if n == -1 else int(n), p) for n, p in bad.index])
+
+    # every node must use the same value list for a property
+    value_sets = df.groupby([keys, df['Property']])['Value'].agg(lambda x: tuple(sorted(x))).reset_index()
+    inconsistent = value_sets.groupby('Property')['Value'].nunique()
+    if (inconsistent > 1).any():
+        errors.append('Values differ between nodes for %s' % inconsistent[inconsistent > 1].index.tolist())
+
+    if node_ids is not None:
+        unknown = df.loc[df['node_id'].notnull() & ~df['node_id'].isin(list(node_ids)), 'node_id'].unique()
+        if len(unknown):
+            errors.append('Nodes not in demographics: %s' % [int(n) for n in unknown])
+    return errors
+
+
+def _ip_entries(df):
+    return [{'Property': prop,
+             'Values': pdf['Value'].tolist(),
+             'Initial_Distribution': pdf['Initial_Distribution'].tolist(),
+             'Transitions': []}
+            for prop, pdf in df.groupby('Property', sort=False)]
+
+
+def generate_ip_overlay(df, overlay_fname, demographics_fname=None):
+    """
+    Write a demographics overlay with IndividualProperties from a long-form table
+    :param df: table as returned by ip_table (several tables can be concatenated); rows with a NaN node_id go to
+    Defaults, other rows become per-node entries, which inherit any Defaults property they don't override
+    :param overlay_fname: output file, e.g. sites/all/demographics_net_overlay.json
+    :param demographics_fname: base demographics file; when given, node ids are checked against it and its IdReference
+    is reused
+    :return: the overlay dict
+    """
+    node_ids, id_reference = None, 'default'
+    if demographics_fname:
+        with DemographicsFile(demographics_fname) as demog:
+            node_ids = demog.node_ids
+            id_reference = (demog.block('Metadata') or {}).get('IdReference', id_reference)
+
+    errors = validate_ip_table(df, node_ids)
+    if errors:
+        raise ValueError('Invalid IndividualProperties table:\n' + '\n'.join(errors))
+
+    is_default = df['node_id'].isnull()
+    defaults = df[is_default]
+    nodes = []
+    for node_id, ndf in df[~is_default].groupby('node_id', sort=False):
+        inherited = defaults[~defaults['Property'].isin(ndf['Property'])]
+        nodes.append({'NodeID': int(node_id),
+                      'IndividualProperties': _ip_entries(pd.concat([inherited, ndf]))})
+
+    overlay = {'Defaults': {'IndividualProperties': _ip_entries(defaults)} if len(defaults) else {},
+               'Metadata': {'Author': 'idm',
+                            'DateCreated': str(datetime.datetime.now()),
+                            'IdReference': id_reference,
+                            'NodeCount': len(node_ids) if node_ids is not None else len(nodes),
+                            'Tool': 'dtk-tools'},
+               'Nodes': nodes}
+    with open(overlay_fname, 'w') as f:
+        json.dump(overlay, f, indent=4)
+    return overlay
+
+
+def net_usage_ip_table(hates_net_prop, node_ids=None):
+    """
+    NetUsage table matching the hand-written demographics_net_overlay.json; pass a (nodes,) array of hates_net_prop
+    with node_ids to vary net aversion by node.
+    """
+    hates_net_prop = np.asarray(hates_net_prop, dtype=float)
+    return ip_table('NetUsage', ['HatesNets', 'LovesNets'],
+                    np.stack([hates_net_prop, 1 - hates_net_prop], axis=-1), node_ids)
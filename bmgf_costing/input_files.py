@@ -0,0 +1,228 @@
+"""
+Incremental generation of the multi-site inputs in a site input directory (sites/all): demographics.json,
+demographics_net_overlay.json and the climate .bin files.
+
+Every site gets content hashes built from its row in site_details.csv, its row in vector_proportions.csv and the build
+parameters. The hashes of the last build are kept in input_manifest.json next to the inputs, and only sites whose hash
+changed (or that are new) are rebuilt; all other nodes are carried over from the existing files. When no manifest exists
+yet, nodes already present in the files are adopted as-is for climate and rebuilt for demographics.
+"""
+
+import os
+import json
+import hashlib
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from climate_files import CLIMATE_FILENAMES, ClimateFile, write_climate_file
+from demographics_files import generate_ip_overlay
+
+MANIFEST_FNAME = 'input_manifest.json'
+MANIFEST_VERSION = 1
+DEMOGRAPHICS_FNAME = 'demographics.json'
+OVERLAY_FNAME = 'demographics_net_overlay.json'
+
+
+def content_hash(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def load_json(fname, default=None):
+    try:
+        with open(fname) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def write_json(fname, obj, indent=4):
+    tmp_fname = fname + '.tmp'
+    with open(tmp_fname, 'w') as f:
+        json.dump(obj, f, indent=indent)
+    os.replace(tmp_fname, fname)
+
+
+def site_records(site_details_fname, vector_props_fname):
+    """
+    Join site_details.csv and vector_proportions.csv on node id
+    :return: list of (site dict, vector proportion dict) in site_details order
+    """
+    sites = pd.read_csv(site_details_fname)
+    vectors = pd.read_csv(vector_props_fname).set_index('node_id')
+    missing = sites.loc[~sites['nodeid'].isin(vectors.index), 'name'].tolist()
+    if missing:
+        raise ValueError('No vector proportions for sites %s' % missing)
+
+    species = [c for c in vectors.columns if c != 'name']
+    vectors = vectors.loc[sites['nodeid'], species]
+    return list(zip(json.loads(sites.to_json(orient='records')),
+                    json.loads(vectors.to_json(orient='records'))))
+
+
+def country_vitals_from_demographics(demographics, sites):
+    """
+    Recover per-country crude birth rate and IndividualAttributes from nodes already in a demographics file, so new
+    sites in a country we already cover can be built without external data.
+    """
+    nodes = {n['NodeID']: n for n in demographics.get('Nodes', [])}
+    vitals = {}
+    for site, _ in sites:
+        node = nodes.get(site['nodeid'])
+        if node is None or site['birth_rate_country'] in vitals:
+            continue
+        attrs = node['NodeAttributes']
+        vitals[site['birth_rate_country']] = {
+            'CrudeBirthRate': attrs['BirthRate'] * 365 * 1000 / attrs['InitialPopulation'],
+            'IndividualAttributes': node['IndividualAttributes']}
+    return vitals
+
+
+def build_demographics_node(site, vector_props, pop, vitals, vectors_per_node):
+
+    return {
+        'NodeID': int(site['nodeid']),
+        'NodeAttributes': {
+            'Latitude': site['lat'],
+            'Longitude': site['lon'],
+            'InitialPopulation': pop,
+            'FacilityName': site['name'],
+            'LarvalHabitatMultiplier': 1.0,
+            'BirthRate': vitals['CrudeBirthRate'] / 1000 / 365 * pop,
+            'InitialVectorsPerSpecies': {sp: int(round(prop * vectors_per_node)) for sp, prop in vector_props.items()}
+        },
+        'IndividualAttributes': vitals['IndividualAttributes']
+    }
+
+
+def build_site(args):
+    """
+    Build the inputs of one stale site; runs in a worker process
+    :return: (demographics node or None, {channel: values} or None)
+    """
+    site, vector_props, pop, vitals, vectors_per_node, climate_fn = args
+    node = build_demographics_node(site, vector_props, pop, vitals, vectors_per_node) if vitals else None
+    climate = None
+    if climate_fn:
+        climate = {ch: np.asarray(v, dtype=np.float32) for ch, v in climate_fn(site).items()}
+    return node, climate
+
+
+def generate_input_files(site_input_dir, pop=2000, overwrite=False, site_details_fname='site_details.csv',
+                         country_vitals=None, climate_fn=None, ip_table=None, vectors_per_node=None,
+                         num_workers=None):
+    """
+    Bring the inputs in site_input_dir up to date with site_details.csv and vector_proportions.csv
+    :param site_input_dir: e.g. sites/all
+    :param pop: InitialPopulation of every node
+    :param overwrite: rebuild every site regardless of the manifest
+    :param site_details_fname: site list with name, lat, lon, birth_rate_country and nodeid columns
+    :param country_vitals: {birth_rate_country: {'CrudeBirthRate': per 1000 per year, 'IndividualAttributes': {...}}};
+    countries already in demographics.json are filled in from there
+    :param climate_fn: function of a site dict returning {channel: daily values} for each key in CLIMATE_FILENAMES;
+    only needed when a site's location is new or has changed
+    :param ip_table: long-form IndividualProperties table (see demographics_files.ip_table) to generate the overlay
+    from; by default the existing overlay is kept and only pruned to the current nodes
+    :param vectors_per_node: total InitialVectorsPerSpecies per node, split by vector proportion; defaults to 10*pop
+    :param num_workers: processes used to build stale sites
+    :return: list of names of the sites that were rebuilt
+    """
+    vectors_per_node = vectors_per_node or 10 * pop
+    sites = site_records(site_details_fname, os.path.join(site_input_dir, 'vector_proportions.csv'))
+    node_ids = [int(site['nodeid']) for site, _ in sites]
+    if len(set(node_ids)) != len(node_ids):
+        raise ValueError('Duplicate nodeid in %s' % site_details_fname)
+
+    manifest_fname = os.path.join(site_input_dir, MANIFEST_FNAME)
+    manifest = load_json(manifest_fname, {})
+    if overwrite or manifest.get('version') != MANIFEST_VERSION:
+        previous = {}
+    else:
+        previous = manifest.get('sites', {})
+    demo_fname = os.path.join(site_input_dir, DEMOGRAPHICS_FNAME)
+    demographics = load_json(demo_fname, {})
+
+    current = {}
+    for site, vector_props in sites:
+        current[str(site['nodeid'])] = {
+            'name': site['name'],
+            'demographics': content_hash([site, vector_props, pop, vectors_per_node]),
+            'climate': content_hash([site['nodeid'], site['lat'], site['lon']])}
+
+    stale_demo = [nid for nid, h in current.items() if previous.get(nid, {}).get('demographics') != h['demographics']]
+    stale_climate = [nid for nid, h in current.items() if previous.get(nid, {}).get('climate') != h['climate']]
+    removed = [nid for nid in previous if nid not in current]
+    added = [nid for nid in current if nid not in previous]
+    overlay_hash = content_hash(ip_table.to_json()) if ip_table is not None else manifest.get('overlay')
+    stale_overlay = overlay_hash != manifest.get('overlay') or overwrite
+    input_fnames = [demo_fname, os.path.join(site_input_dir, OVERLAY_FNAME)] + \
+                   [os.path.join(site_input_dir, f) for f in CLIMATE_FILENAMES.values()]
+    if not (stale_demo or stale_climate or removed or stale_overlay) and all(os.path.exists(f) for f in input_fnames):
+        print('input files in %s are up to date' % site_input_dir)
+        return []
+
+    # climate on disk is reused unless the site moved; nodes with no manifest record are adopted as they are
+    climate = {}
+    for ch, fname in CLIMATE_FILENAMES.items():
+        fname = os.path.join(site_input_dir, fname)
+        climate[ch] = ClimateFile(fname) if os.path.exists(fname) else None
+    if not (overwrite and climate_fn):
+        stale_climate = [nid for nid in stale_climate if nid in previous or
+                         not all(cf is not None and nid in cf for cf in climate.values())]
+
+    vitals = country_vitals_from_demographics(demographics, sites)
+    vitals.update(country_vitals or {})
+
+    stale = [(site, vector_props) for site, vector_props in sites
+             if str(site['nodeid']) in stale_demo or str(site['nodeid']) in stale_climate]
+    missing_vitals = sorted(set(site['birth_rate_country'] for site, _ in stale
+                                if str(site['nodeid']) in stale_demo and site['birth_rate_country'] not in vitals))
+    if missing_vitals:
+        raise ValueError('No birth rate / mortality for %s; pass them in country_vitals' % missing_vitals)
+    if not climate_fn and any(str(site['nodeid']) in stale_climate for site, _ in stale):
+        raise ValueError('Climate is needed for new or moved sites %s; pass a climate_fn'
+                         % [site['name'] for site, _ in stale if str(site['nodeid']) in stale_climate])
+
+    print('rebuilding inputs for %d of %d sites' % (len(stale), len(sites)))
+    jobs = [(site, vector_props, pop,
+             vitals[site['birth_rate_country']] if str(site['nodeid']) in stale_demo else None,
+             vectors_per_node,
+             climate_fn if str(site['nodeid']) in stale_climate else None)
+            for site, vector_props in stale]
+    if len(jobs) > 1 and num_workers != 1:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            results = list(executor.map(build_site, jobs))
+    else:
+        results = [build_site(job) for job in jobs]
+    built = {str(site['nodeid']): result for (site, _), result in zip(stale, results)}
+
+    # demographics
+    if stale_demo or removed or not os.path.exists(demo_fname):
+        existing_nodes = {str(n['NodeID']): n for n in demographics.get('Nodes', [])}
+        demographics['Nodes'] = [built[nid][0] if nid in stale_demo else existing_nodes[nid] for nid in current]
+        demographics.setdefault('Metadata', {}).update({'NodeCount': len(current),
+                                                        'DateCreated': str(datetime.datetime.now())})
+        write_json(demo_fname, demographics)
+
+    # overlay: generated from ip_table, otherwise per-node entries of sites that are gone are dropped
+    overlay_fname = os.path.join(site_input_dir, OVERLAY_FNAME)
+    if ip_table is not None and (stale_overlay or stale_demo or removed):
+        generate_ip_overlay(ip_table[ip_table['node_id'].isnull() | ip_table['node_id'].isin(node_ids)],
+                            overlay_fname, demo_fname)
+    elif ip_table is None and (stale_demo or removed):
+        overlay = load_json(overlay_fname, {'Defaults': {}, 'Metadata': {}, 'Nodes': []})
+        overlay['Nodes'] = [n for n in overlay.get('Nodes', []) if str(n['NodeID']) in current]
+        overlay['Metadata']['NodeCount'] = len(current)
+        write_json(overlay_fname, overlay)
+
+    # climate
+    for ch in (CLIMATE_FILENAMES if stale_climate or added or removed else []):
+        cf = climate.pop(ch)
+        values = np.stack([built[nid][1][ch] if nid in stale_climate else np.array(cf[nid]) for nid in current])
+        metadata = cf.metadata if cf is not None else {}
+        cf = None  # drop the mmap before the file is replaced
+        write_climate_file(os.path.join(site_input_dir, CLIMATE_FILENAMES[ch]), node_ids, values, metadata)
+
+    write_json(manifest_fname, {'version': MANIFEST_VERSION, 'sites': current, 'overlay': overlay_hash})
+    return [current[nid]['name'] for nid in current if nid in stale_demo or nid in stale_climate]
@@ -0,0 +1,144 @@
+"""
+Consistency checks across the multi-site inputs, run before an experiment is submitted so that a mismatch doesn't first
+show up after a burn-in has run on the cluster.
+
+Checks are joins and array reductions over whole tables rather than per-site loops:
+- site_details.csv nodeid vs vector_proportions.csv node_id, demographics NodeIDs and every climate file's NodeOffsets
+- species proportions per node are non-negative and sum to 1, and every species in species_details.json has a
+  proportion column
+- each species' habitat_split in species_details.json sums to 1
+With check_values, the climate series are also scanned for non-finite values and the demographics NodeAttributes are
+compared with the site tables; these read the data itself, so skip them for a fast id-only pass over large site sets.
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from climate_files import STEPS_PER_YEAR, open_site_climate
+from demographics_files import DemographicsFile
+
+
+def _id_mismatches(left, right, left_name, right_name):
+    merged = pd.merge(pd.DataFrame({'node': left}), pd.DataFrame({'node': right}), on='node', how='outer',
+                      indicator=True)
+    errors = []
+    only_left = merged.loc[merged['_merge'] == 'left_only', 'node'].tolist()
+    only_right = merged.loc[merged['_merge'] == 'right_only', 'node'].tolist()
+    if only_left:
+        errors.append('nodes in %s but not in %s: %s' % (left_name, right_name, only_left))
+    if only_right:
+        errors.append('nodes in %s but not in %s: %s' % (right_name, left_name, only_right))
+    return errors
+
+
+def _duplicates(ids, name):
+    ids = pd.Series(ids)
+    dupes = ids[ids.duplicated()].unique().tolist()
+    return ['duplicate node ids in %s: %s' % (name, dupes)] if dupes else []
+
+
+def validate_inputs(site_input_dir, site_details_fname='site_details.csv',
+                    species_details_fname='species_details.json', check_values=True, tolerance=1e-4):
+    """
+    :param site_input_dir: e.g. sites/all
+    :param site_details_fname: site list with name and nodeid columns
+    :param species_details_fname: species_details.json
+    :param check_values: also scan climate values and demographics NodeAttributes
+    :param tolerance: allowed deviation of proportion sums from 1
+    :return: list of problems; empty when the inputs are consistent
+    """
+    errors = []
+    sites = pd.read_csv(site_details_fname)
+    vectors = pd.read_csv(os.path.join(site_input_dir, 'vector_proportions.csv'))
+    with open(species_details_fname) as f:
+        species_details = json.load(f)
+    # validation only reads the inputs: no index sidecar is left in the site input directory
+    demog = DemographicsFile(os.path.join(site_input_dir, 'demographics.json'), cache_index=False)
+    climate = open_site_climate(site_input_dir)
+
+    # node ids
+    site_ids = sites['nodeid'].to_numpy(dtype=np.int64)
+    errors += _duplicates(site_ids, site_details_fname)
+    errors += _duplicates(vectors['node_id'], 'vector_proportions.csv')
+    errors += _id_mismatches(site_ids, vectors['node_id'].to_numpy(dtype=np.int64),
+                             site_details_fname, 'vector_proportions.csv')
+    errors += _id_mismatches(site_ids, np.asarray(demog.node_ids, dtype=np.int64), site_details_fname,
+                             'demographics.json')
+    for ch, cf in climate.items():
+        errors += _duplicates(cf.node_ids, cf.fname)
+        errors += _id_mismatches(site_ids, cf.node_ids, site_details_fname, os.path.basename(cf.fname))
+        steps = STEPS_PER_YEAR.get(cf.metadata.get('UpdateResolution', 'CLIMATE_UPDATE_DAY'))
+        if steps is None or cf.num_values % steps:
+            errors.append('%s: %d values is not a whole number of years at %s'
+                          % (cf.fname, cf.num_values, cf.metadata.get('UpdateResolution')))
+
+    named = pd.merge(sites[['name', 'nodeid']], vectors[['name', 'node_id']], left_on='nodeid', right_on='node_id',
+                     suffixes=('', '_vectors'))
+    renamed = named[named['name'] != named['name_vectors']]
+    if len(renamed):
+        errors.append('site names differ between site_details and vector_proportions for nodes %s'
+                      % renamed['nodeid'].tolist())
+
+    # species proportions
+    species = [c for c in vectors.columns if c not in ('name', 'node_id')]
+    missing_species = [sp for sp in species_details if sp not in species]
+    if missing_species:
+        errors.append('species in %s without a vector_proportions column: %s' % (species_details_fname,
+                                                                                 missing_species))
+    props = vectors[species].to_numpy(dtype=float)
+    bad_rows = ~np.isclose(props.sum(axis=1), 1, atol=tolerance) | (props < 0).any(axis=1) | np.isnan(props).any(axis=1)
+    if bad_rows.any():
+        errors.append('species proportions are negative or do not sum to 1 for %s'
+                      % vectors.loc[bad_rows, 'name'].tolist())
+
+    splits = pd.DataFrame([{'species': sp, 'habitat': hab, 'fraction': frac}
+                           for sp, details in species_details.items()
+                           for hab, frac in details.get('habitat_split', {}).items()])
+    if len(splits):
+        sums = splits.groupby('species')['fraction'].sum()
+        bad = sums[~np.isclose(sums, 1, atol=tolerance)]
+        if len(bad):
+            errors.append('habitat_split does not sum to 1 for %s' % bad.round(6).to_dict())
+        if (splits['fraction'] < 0).any():
+            errors.append('negative habitat_split for %s' % splits.loc[splits['fraction'] < 0, 'species'].unique())
+
+    if check_values:
+        for ch, cf in climate.items():
+            bad_nodes = cf.node_ids[~np.isfinite(cf.values()).all(axis=1)]
+            if len(bad_nodes):
+                errors.append('non-finite %s values for nodes %s' % (ch, bad_nodes.tolist()))
+
+        attrs = demog.node_attributes(['InitialPopulation', 'Latitude', 'Longitude'],
+                                      [n for n in site_ids if n in demog])
+        merged = pd.merge(sites, attrs, left_on='nodeid', right_index=True)
+        bad = merged[(merged['InitialPopulation'].fillna(0) <= 0) |
+                     ~np.isclose(merged['lat'], merged['Latitude'], atol=1e-3) |
+                     ~np.isclose(merged['lon'], merged['Longitude'], atol=1e-3)]
+        if len(bad):
+            errors.append('demographics NodeAttributes (InitialPopulation, Latitude, Longitude) disagree with %s '
+                          'for %s' % (site_details_fname, bad['name'].tolist()))
+
+        initial_vectors = demog.vectors_per_species([n for n in site_ids if n in demog])
+        shared = [sp for sp in species if sp in initial_vectors.columns]
+        if shared:
+            counts = initial_vectors[shared]
+            fractions = counts.div(counts.sum(axis=1).replace(0, np.nan), axis=0).fillna(0)
+            expected = vectors.set_index('node_id').loc[fractions.index, shared]
+            bad = fractions.index[~np.isclose(fractions.to_numpy(), expected.to_numpy(), atol=1e-3).all(axis=1)]
+            if len(bad):
+                errors.append('InitialVectorsPerSpecies do not match vector_proportions for nodes %s' % bad.tolist())
+
+    demog.close()
+    return errors
+
+
+def check_inputs(site_input_dir, **kwargs):
+    """
+    validate_inputs that raises instead of returning the problems
+    """
+    errors = validate_inputs(site_input_dir, **kwargs)
+    if errors:
+        raise ValueError('Inconsistent inputs in %s:\n' % site_input_dir + '\n'.join(errors))
+    print('inputs in %s are consistent' % site_input_dir)
@@ -0,0 +1,102 @@
+"""
+Named intervention packages for the multi-site sweeps, read from intervention_packages.csv.
+
+Each row of the table is one component (itn, irs or atsb) of a package; a package with an empty component adds nothing
+(e.g. 'none'). A package's campaign events are built once on a scratch config builder, compacted (see
+campaign_compaction) and cached, and every simulation then gets deep copies of the cached events instead of re-running
+the builder functions.
+"""
+
+import copy
+import pandas as pd
+
+from dtk.utils.core.DTKConfigBuilder import DTKConfigBuilder
+from sweep_functions import add_annual_itns, add_irs_group, add_atsb_by_coverage
+from campaign_compaction import compact_events
+
+PACKAGES_FNAME = 'intervention_packages.csv'
+
+
+def _ip_restrictions(value):
+    if not isinstance(value, str) or not value:
+        return []
+    return [dict([restriction.split(':')]) for restriction in value.split(';')]
+
+
+def _add_itn(cb, component, years, species):
+    add_annual_itns(cb, year_count=years if component['every_year'] else 1,
+                    coverage=component['coverage'],
+                    initial_killing=component['killing'],
+                    discard_time=component['discard_time'],
+                    start_day=int(component['start_day']),
+                    IP=_ip_restrictions(component['ip_restriction']))
+
+
+def _add_irs(cb, component, years, species):
+    add_irs_group(cb, coverage=component['coverage'], decay=component['decay'],
+                  start_days=[int(component['start_day']) + 365 * year
+                              for year in range(years if component['every_year'] else 1)])
+
+
+def _add_atsb(cb, component, years, species):
+    add_atsb_by_coverage(cb, component['coverage'],
+                         killing=component['killing'],
+                         species_list=species,
+                         start=int(component['start_day']))
+
+
+COMPONENT_BUILDERS = {'itn': _add_itn,
+                      'irs': _add_irs,
+                      'atsb': _add_atsb}
+
+
+def load_packages(fname=PACKAGES_FNAME):
+    """
+    :return: dict of package name to list of component dicts, in table order
+    """
+    df = pd.read_csv(fname)
+    df['every_year'] = df['every_year'].fillna(0).astype(bool)
+    unknown = set(df['component'].dropna()) - set(COMPONENT_BUILDERS)
+    if unknown:
+        raise ValueError('Unknown intervention components in %s: %s' % (fname, sorted(unknown)))
+
+    return {name: [c for c in pdf.to_dict('records') if isinstance(c['component'], str)]
+            for name, pdf in df.groupby('intervention', sort=False)}
+
+
+class InterventionRegistry:
+
+    def __init__(self, species, years, fname=PACKAGES_FNAME):
+        """
+        :param species: vector species targeted by ATSB components
+        :param years: simulation years, for components repeated every year
+        :param fname: package table
+        """
+        self.species = list(species)
+        self.years = years
+        self.packages = load_packages(fname)
+        self._events = {}
+
+    @property
+    def names(self):
+        return list(self.packages.keys())
+
+    def events(self, name):
+        """
+        Campaign events of a package, built on first use
+        """
+        if name not in self._events:
+            if name not in self.packages:
+                raise ValueError('Unknown intervention package %s; known packages are %s' % (name, self.names))
+            scratch = DTKConfigBuilder.from_defaults('MALARIA_SIM')
+            scratch.campaign.Events = []
+            for component in self.packages[name]:
+                COMPONENT_BUILDERS[component['component']](scratch, component, self.years, self.species)
+            self._events[name], _ = compact_events(scratch.campaign.Events)
+        return self._events[name]
+
+    def add(self, cb, name):
+        # one deepcopy per simulation, so simulations never share the cached events
+        for event in copy.deepcopy(self.events(name)):
+            cb.add_event(event)
+        return {'intervention': name}
@@ -1,4 +1,5 @@
 import os
+import sys
 import pandas as pd
 import numpy as np
 import json
@@ -16,6 +17,17 @@ from simtools.Utilities.Experiments import retrieve_experiment
 from malaria.interventions.health_seeking import add_health_seeking
 
 from sweep_functions import *
+from input_files import generate_input_files
+from site_registry import SiteRegistry
+from input_validation import check_inputs
+from sweep_builders import burnin_pickup_fns, mod_product, paired_arm_fns, run_sharded
+from serialization_catalog import SerializationCatalog
+from intervention_registry import InterventionRegistry
+from campaign_compaction import compact_campaign
+from replicate_tuning import required_replicates, runs_per_habitat
+from sweep_manifest import SweepManifest
+from demographics_files import net_usage_ip_table
+from result_sink import load_results
 
 # variables
 run_type = "intervention"  # set to "burnin" or "intervention"
@@ -25,10 +37,17 @@ asset_exp_id = "66d8416c-9fce-e811-a2bd-c4346bcb1555"
 intervention_coverages = [100]
 interventions = ["llin_no_disc"]
 num_runs = 40
+pilot_runs = None # run this many seeds first and size the remaining runs from their variance (up to num_runs)
+ci_targets = {'PfPR2to10': 0.01, 'New_Clinical_Cases': 50} # confidence interval half-widths for pilot_runs
 # hs_daily_probs = [0.15, 0.3, 0.7]
 
 hates_net_prop = 0.1 # based on expert opinion from Caitlin
+net_ip_from_overlay = False # set NetUsage through the demographics overlay instead of campaign events
 new_inputs = False
+baseline_pfprs = None # pick the burn-ins of burnin_id by equilibrium PfPR2to10 at pfpr_reference_site instead of running all of them
+pfpr_reference_site = None # a site in site_details.csv; the first one by default
+shard_size = None # split the sweep into experiments of at most this many sims
+completed_exp_ids = [] # earlier experiments of this sweep; points they completed are not resubmitted
 
 # Serialization
 print("setting up")
@@ -67,13 +86,16 @@ cb.update_params({"Disable_IP_Whitelist": 1,
                   "Enable_Property_Output": 0,
                   "Enable_Spatial_Output": 1,
                   "Spatial_Output_Channels": ["Population", "Blood_Smear_Parasite_Prevalence", 'New_Infections',
-                                              'New_Clinical_Cases']
+                                              'New_Clinical_Cases'] +
+                                             # equilibrium vector counts for the serialization catalog
+                                             (['Adult_Vectors'] if run_type == "burnin" else [])
                   })
 
 if serialize:
     cb.update_params({"Serialization_Time_Steps": [365*years]})
 
-assign_net_ip(cb, hates_net_prop)
+if not net_ip_from_overlay:
+    assign_net_ip(cb, hates_net_prop)
 add_health_seeking(cb, start_day=0,
                    drug=['Artemether', 'Lumefantrine'],
                    targets=[
@@ -86,69 +108,43 @@ add_health_seeking(cb, start_day=0,
                    )
 
 
-def add_intervention(cb, intervention, species_details) :
-
-    if intervention == 'itn' :
-        add_annual_itns(cb, year_count=1,
-                        coverage=60. / 100,
-                        initial_killing=0.3,
-                        start_day=5,
-                        IP=[{"NetUsage": "LovesNets"}]
-          )
-    elif intervention == 'llin' :
-        add_annual_itns(cb, year_count=1,
-                        coverage=60. / 100,
-                        initial_killing=0.8,
-                        start_day=5,
-                        IP=[{"NetUsage": "LovesNets"}]
-          )
-    elif intervention == 'llin_no_disc':
-        add_annual_itns(cb, year_count=1,
-                        coverage=60. / 100,
-                        initial_killing=0.8,
-                        discard_time=365*50,
-                        start_day=5,
-                        IP=[{"NetUsage": "LovesNets"}]
-                        )
-    elif intervention == 'irs_180' :
-        add_irs_group(cb, coverage=60 / 100, decay=180,
-                      start_days=[365 * start for start in range(years)])
-        add_annual_itns(cb, year_count=1,
-                        coverage=60. / 100,
-                        initial_killing=0.3,
-                        start_day=5,
-                        IP=[{"NetUsage": "LovesNets"}]
-          )
-    elif intervention == 'atsb_cdc' :
-        add_atsb_by_coverage(cb, 60 / 100.,
-                             killing=0.115,
-                             species_list=list(species_details.keys()))
-        add_annual_itns(cb, year_count=1,
-                        coverage=60. / 100,
-                        initial_killing=0.3,
-                        start_day=5,
-                        IP=[{"NetUsage": "LovesNets"}]
-          )
-    elif intervention == 'atsb_hlc':
-        add_atsb_by_coverage(cb, 60 / 100.,
-                             killing=0.0337,
-                             species_list=list(species_details.keys()))
-        add_annual_itns(cb, year_count=1,
-                        coverage=60. / 100,
-                        initial_killing=0.3,
-                        start_day=5,
-                        IP=[{"NetUsage": "LovesNets"}]
-                        )
-    elif intervention == 'atsb_alone_cdc' :
-        add_atsb_by_coverage(cb, 60 / 100.,
-                             killing=0.115,
-                             species_list=list(species_details.keys()))
-    elif intervention == 'atsb_alone_hlc':
-        add_atsb_by_coverage(cb, 60 / 100.,
-                             killing = 0.0337,
-                             species_list = list(species_details.keys()))
-
-    return {'intervention' : intervention}
+def add_intervention(cb, intervention, registry) :
+
+    # packages and their coverage/killing values live in intervention_packages.csv
+    return registry.add(cb, intervention)
+
+
+def run_pilot_and_tune(cb, pilot_mod_lists, burnin_df, state_files, registry, sites, manifest):
+
+    from simtools.Analysis.AnalyzeManager import AnalyzeManager
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "analyzers"))
+    from atsb_llin_impact_analyzer import ATSBAnalyzer
+
+    # pilot batch
+    managers = run_sharded(cb, "%s_pilot" % sweep_name, pilot_mod_lists, shard_size=shard_size or 10000)
+    for em in managers:
+        em.wait_for_finished(verbose=True)
+    analyzer = ATSBAnalyzer(expt_name="%s_pilot" % sweep_name, report_names=sites.names,
+                            sweep_variables=["Run_Number", "x_Temporary_Larval_Habitat", "intervention", "CRN_Pair"])
+    pilot_exp_ids = [str(em.experiment.exp_id) for em in managers]
+    for exp_id in pilot_exp_ids:
+        manifest.add_experiment(exp_id, sweep=sweep_name)
+    AnalyzeManager(exp_list=pilot_exp_ids, analyzers=[analyzer], force_analyze=True).analyze()
+    pilot = load_results(os.path.join(analyzer.working_dir, analyzer.expt_name), exp_ids=pilot_exp_ids)
+
+    # remaining runs per habitat, sized from the paired between-seed variance when there is a baseline arm
+    baseline = "none" if "none" in interventions else None
+    required = required_replicates(pilot, ci_targets, baseline=baseline)
+    runs = runs_per_habitat(required, min_runs=pilot_runs, max_runs=num_runs)
+    print("scheduling %d further runs" % sum(n - pilot_runs for n in runs.values()))
+
+    # pair ids continue after the pilot's, one per (burn-in, Run_Number)
+    mod_lists = paired_arm_fns(burnin_pickup_fns(burnin_df, runs, state_files, first_run=pilot_runs),
+                               [ModFn(add_intervention, intervention, registry) for intervention in interventions],
+                               first_pair=len(burnin_df) * pilot_runs)
+    # tagged and filtered like the main submission, so the tuned runs are recorded and skipped on a rerun
+    mod_lists = manifest.missing(cb, mod_lists, sweep=sweep_name)
+    return run_sharded(cb, sweep_name, mod_lists, shard_size=shard_size or 10000)
 
 
 if __name__=="__main__":
@@ -157,14 +153,9 @@ if __name__=="__main__":
 
     # collect site-specific data to pass to builder functions
     COMPS_login("https://comps.idmod.org")
-    sites = pd.read_csv("site_details.csv")
-
     print("finding collection ids and vector details")
     site_input_dir = os.path.join("sites", "all")
 
-    with open("species_details.json") as f:
-        species_details = json.loads(f.read())
-
     if asset_exp_id:
         print("retrieving asset experiment")
         asset_expt = retrieve_experiment(asset_exp_id)
@@ -174,12 +165,19 @@ if __name__=="__main__":
         cb.set_input_collection(template_asset["input_collection_id"])
 
     if new_inputs:
-        print("generating input files")
-        generate_input_files(site_input_dir, pop=2000, overwrite=True)
+        print("updating input files")
+        generate_input_files(site_input_dir, pop=2000,
+                             ip_table=net_usage_ip_table(hates_net_prop) if net_ip_from_overlay else None)
+
+    check_inputs(site_input_dir)
 
     # Find vector proportions for each vector in our site
-    site_vectors = pd.read_csv(os.path.join(site_input_dir, "vector_proportions.csv"))
+    sites = SiteRegistry(vector_props_fname=os.path.join(site_input_dir, "vector_proportions.csv"))
+    species_details = sites.species_details
+    site_vectors = sites.vector_props()
     simulation_setup(cb, species_details, site_vectors)
+    compact_campaign(cb)
+    registry = InterventionRegistry(species=species_details.keys(), years=years)
 
     # reporting
     for idx, row in site_vectors.iterrows():
@@ -196,47 +194,51 @@ if __name__=="__main__":
     if pull_from_serialization:
         print("building from pickup")
 
-        # serialization
+        # serialization: burn-ins are looked up in the local catalog, which only goes to COMPS for new experiments
         print("retrieving burnin")
-        expt = retrieve_experiment(burnin_id)
-
-        df = pd.DataFrame([x.tags for x in expt.simulations])
-        df["outpath"] = pd.Series([sim.get_path() for sim in expt.simulations])
-
-        df = df[df['Run_Number'] == 0]
-
-        from_burnin_list = [
-            ModFn(DTKConfigBuilder.update_params, {
-                "Serialized_Population_Path": os.path.join(df["outpath"][x], "output"),
-                "Serialized_Population_Filenames": [name for name in os.listdir(os.path.join(df["outpath"][x], "output")) if "state" in name],
-                "Run_Number": y,
-                "x_Temporary_Larval_Habitat": df["x_Temporary_Larval_Habitat"][x]})
-
-            for x in df.index for y in range(num_runs)]
-
-        builder = ModBuilder.from_list([
-            [burnin_fn,
-             ModFn(add_intervention, intervention, species_details)]
-            for burnin_fn in from_burnin_list
-            for intervention in interventions
-        ])
+        catalog = SerializationCatalog()
+        if not catalog.has_experiment(burnin_id):
+            catalog.add_experiment(burnin_id, site="all")
+        df = catalog.lookup(exp_id=burnin_id, run_number=0)
+        if baseline_pfprs is not None:
+            # nearest serialized population of burnin_id for each baseline
+            reference_site = pfpr_reference_site or sites.names[0]
+            if reference_site not in sites.names:
+                raise ValueError("pfpr_reference_site %s is not one of the sites %s" % (reference_site, sites.names))
+            catalog.add_equilibrium(sites.names, sites.nodeids())
+            df = catalog.nearest(reference_site, baseline_pfprs, burnin_id, site="all").drop_duplicates(subset="sim_id")
+
+        # sims are generated as the experiment manager consumes them
+        from_burnin_list = burnin_pickup_fns(df, pilot_runs or num_runs, catalog.state_files(df))
+
+        # every intervention arm runs from the same burn-in state and Run_Number (common random numbers)
+        mod_lists = paired_arm_fns(from_burnin_list,
+                                   [ModFn(add_intervention, intervention, registry) for intervention in interventions])
 
     else:
         print("building burnin")
-        builder = ModBuilder.from_list([[
-            ModFn(DTKConfigBuilder.update_params, {
-                "Run_Number": run_num,
-                "x_Temporary_Larval_Habitat":10 ** hab_exp}),
-        ]
-            for run_num in range(10)
-            for hab_exp in np.concatenate((np.arange(-3.75, -2, 0.25), np.arange(-2, 2.25, 0.1)))
-            # for hab_exp in [0, 1, 2]
-        ])
-
-    run_sim_args = {"config_builder": cb,
-                    "exp_name": sweep_name,
-                    "exp_builder": builder}
-
-    em = ExperimentManagerFactory.from_cb(cb)
-    em.run_simulations(**run_sim_args)
+        mod_lists = mod_product(
+            [ModFn(DTKConfigBuilder.set_param, "Run_Number", run_num) for run_num in range(10)],
+            [ModFn(DTKConfigBuilder.set_param, "x_Temporary_Larval_Habitat", 10 ** hab_exp)
+             for hab_exp in np.concatenate((np.arange(-3.75, -2, 0.25), np.arange(-2, 2.25, 0.1)))
+             # for hab_exp in [0, 1, 2]
+             ])
+
+    # every point is tagged with its hash so later runs of this sweep can skip it, and points that earlier experiments
+    # of this sweep completed are not submitted again
+    manifest = SweepManifest()
+    for exp_id in completed_exp_ids:
+        manifest.add_experiment(exp_id, sweep=sweep_name)
+    mod_lists = manifest.missing(cb, mod_lists, sweep=sweep_name)
+
+    if pilot_runs and pull_from_serialization:
+        run_pilot_and_tune(cb, mod_lists, df, catalog.state_files(df), registry, sites, manifest)
+    elif shard_size:
+        run_sharded(cb, sweep_name, mod_lists, shard_size=shard_size)
+    else:
+        run_sim_args = {"config_builder": cb,
+                        "exp_name": sweep_name,
+                        "exp_builder": ModBuilder.from_list(mod_lists)}
 
+        em = ExperimentManagerFactory.from_cb(cb)
+        em.run_simulations(**run_sim_args)
@@ -0,0 +1,55 @@
+"""
+Paired (common random number) comparisons between intervention arms.
+
+Every arm of a sweep picks up the same serialized burn-in with the same Run_Number at each (site, habitat) point (see
+sweep_builders.paired_arm_fns), so the stochastic noise shared between arms cancels when differences are taken seed by
+seed instead of differencing arm means. The standard error of a paired difference is then driven only by the
+arm-specific noise, which is what determines how many runs are needed.
+"""
+
+import numpy as np
+import pandas as pd
+
+# CRN_Pair is tagged by paired_arm_fns; older experiments are paired on habitat and Run_Number alone
+PAIR_KEYS = ['Site_Name', 'x_Temporary_Larval_Habitat', 'Run_Number', 'CRN_Pair']
+
+
+def paired_differences(df, baseline, channels, keys=PAIR_KEYS, arm='intervention'):
+    """
+    Per-seed differences baseline - arm, matched on the pairing keys
+    :param df: one row per (simulation, site), e.g. atsb_llin_impact_analyzer output
+    :param baseline: name of the baseline arm, e.g. 'none' or 'itn'
+    :param channels: channels to difference, e.g. ['New_Clinical_Cases']
+    :param keys: pairing keys; those missing from df are ignored
+    :return: pandas.DataFrame with the keys, arm, 'baseline <channel>' and 'diff <channel>' columns, one row per pair and
+    non-baseline arm; pairs missing their baseline are dropped
+    """
+    keys = [k for k in keys if k in df.columns]
+    extra = ['PfPR2to10'] if 'PfPR2to10' in df.columns and 'PfPR2to10' not in channels else []
+    base = df[df[arm] == baseline][keys + channels + extra]
+    base = base.rename(columns={c: 'baseline %s' % c for c in base.columns if c not in keys})
+    if base.duplicated(subset=keys).any():
+        raise ValueError('Baseline arm %s has more than one simulation per %s' % (baseline, keys))
+
+    arms = df[df[arm] != baseline]
+    paired = pd.merge(arms[keys + [arm] + channels], base, on=keys, how='inner')
+    for c in channels:
+        paired['diff %s' % c] = paired['baseline %s' % c] - paired[c]
+    return paired.drop(columns=channels)
+
+
+def summarize_differences(paired, channels, by=('Site_Name', 'x_Temporary_Larval_Habitat', 'intervention')):
+    """
+    Mean paired difference, its standard error and the number of pairs per point
+    :param paired: paired_differences output
+    :return: pandas.DataFrame with 'diff <channel>', 'diff_sem <channel>', 'pairs' and the baseline means
+    """
+    by = list(by)
+    grouped = paired.groupby(by)
+    summary = grouped[[c for c in paired.columns if c.startswith('baseline ')]].mean()
+    for c in channels:
+        stats = grouped['diff %s' % c].agg(['mean', 'std', 'count'])
+        summary['diff %s' % c] = stats['mean']
+        summary['diff_sem %s' % c] = stats['std'] / np.sqrt(stats['count'])
+    summary['pairs'] = grouped.size()
+    return summary.reset_index()
@@ -21,6 +21,8 @@ from statsmodels.nonparametric.smoothers_lowess import lowess
 mpl.rcParams['pdf.fonttype'] = 42
 
 from plotting.colors import load_color_palette
+from result_sink import load_results
+from paired_analysis import paired_differences, summarize_differences
 
 projectdir = os.path.join('E:/', 'Dropbox (IDM)', 'Malaria Team Folder', 'projects', 'atsb')
 datadir = os.path.join(projectdir, 'sim_data')
@@ -29,7 +31,7 @@ plotdir = os.path.join(projectdir, 'sim_plots')
 
 def load_sim_df(data_fname):
 
-    df = pd.read_csv(data_fname)
+    df = load_results(data_fname).drop(columns=['exp_id', 'sim_id'], errors='ignore')
     df = df.groupby(['Site_Name', 'x_Temporary_Larval_Habitat', 'intervention']).agg(np.mean).reset_index()
     df['cases per 1000'] = df['New_Clinical_Cases']/df['Population']*1000
     df['infections per 1000'] = df['New_Clinical_Cases']/df['Population']*1000
@@ -77,6 +79,7 @@ def plot_cases_averted(df, name, baseline_channel, ignore_list, savename) :
 
 
 def plot_cost_per_case_averted(df, datachannel, savename, basechannel):
+    # df: one row per simulation and site (not averaged over Run_Number), as written by atsb_llin_impact_analyzer
 
     costs = { 'itn' : [1.85, 2.13, 2.3], # per person
               'llin' : [2.25, 2.5, 3], # per person
@@ -96,21 +99,21 @@ def plot_cost_per_case_averted(df, datachannel, savename, basechannel):
     fig = plt.figure(figsize=(10, 8))
     fig.subplots_adjust(left=0.1, right=0.98, bottom=0.07, top=0.95)
 
-    for s, (site, sdf) in enumerate(df.groupby('Site_Name')):
+    # cases averted are paired by burn-in and Run_Number (common random numbers) before averaging
+    paired = paired_differences(df, basechannel, [datachannel])
+    diffs = summarize_differences(paired, [datachannel])
 
-        sdf = sdf.sort_values(by='PfPR2to10')
+    for s, (site, sdf) in enumerate(diffs.groupby('Site_Name')):
+
+        sdf = sdf.sort_values(by='baseline PfPR2to10')
         ax = fig.add_subplot(3,3,s+1)
-        baseline = sdf[sdf['intervention'] == basechannel]
 
         sdf = sdf[~(sdf['intervention'].isin(['none', 'itn']))]
         for i, (intervention, idf) in enumerate(sdf.groupby('intervention')):
             intervention_type = intervention.split('_')[0]
 
-            minidf = pd.DataFrame( { 'baseline PfPR2to10' : baseline['PfPR2to10'].values,
-                                     'baseline_%s' % datachannel : baseline[datachannel].values,
-                                     '%s_%s' % (intervention, datachannel) : idf[datachannel].values})
-            minidf['diff'] = minidf['baseline_%s' % datachannel] - minidf['%s_%s' % (intervention, datachannel)]
-            mdf = minidf[(minidf['diff'] >= 0) & (minidf['baseline PfPR2to10'] > 0)]
+            mdf = idf.rename(columns={'diff %s' % datachannel: 'diff'})
+            mdf = mdf[(mdf['diff'] >= 0) & (mdf['baseline PfPR2to10'] > 0)]
             palette = sns.color_palette(palettes[i], len(costs[intervention_type]))
 
             for c, single_cost in enumerate(costs[intervention_type]):
@@ -141,6 +144,7 @@ if __name__ == '__main__' :
     data_fname = os.path.join(datadir, "%s.csv" % expt_name)
 
     df = load_sim_df(data_fname)
+    sim_df = load_results(data_fname)
 
     savename = '%s_cases_averted_by_site' % expt_name
     plot_cases_averted(df, 'baseline', 'none', ['none'], '%s_v_baseline' % savename)
@@ -148,23 +152,23 @@ if __name__ == '__main__' :
 
     basechannel = 'itn'
     interventions = ['none', 'itn', 'atsb_cdc', 'atsb_hlc', 'irs_180']
-    sdf = df[df['intervention'].isin(interventions)]
+    sdf = sim_df[sim_df['intervention'].isin(interventions)]
     plot_cost_per_case_averted(sdf, 'New_Clinical_Cases', '%s_part1' % expt_name, basechannel)
     plot_cost_per_case_averted(sdf, 'New_Infections', '%s_part1' % expt_name, basechannel)
 
     interventions = ['none', 'itn', 'llin_no_disc', 'llin']
-    sdf = df[df['intervention'].isin(interventions)]
+    sdf = sim_df[sim_df['intervention'].isin(interventions)]
     plot_cost_per_case_averted(sdf, 'New_Clinical_Cases', '%s_part2' % expt_name, basechannel)
     plot_cost_per_case_averted(sdf, 'New_Infections', '%s_part2' % expt_name, basechannel)
 
     basechannel = 'none'
     interventions = ['none', 'itn', 'llin_no_disc', 'llin']
-    sdf = df[df['intervention'].isin(interventions)]
+    sdf = sim_df[sim_df['intervention'].isin(interventions)]
     plot_cost_per_case_averted(sdf, 'New_Clinical_Cases', '%s_part2' % expt_name, basechannel)
     plot_cost_per_case_averted(sdf, 'New_Infections', '%s_part2' % expt_name, basechannel)
 
     interventions = ['none', 'itn', 'atsb_alone_hlc', 'atsb_alone_cdc']
-    sdf = df[df['intervention'].isin(interventions)]
+    sdf = sim_df[sim_df['intervention'].isin(interventions)]
     plot_cost_per_case_averted(sdf, 'New_Clinical_Cases', '%s_part3' % expt_name, basechannel)
     plot_cost_per_case_averted(sdf, 'New_Infections', '%s_part3' % expt_name, basechannel)
 
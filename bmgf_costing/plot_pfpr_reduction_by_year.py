@@ -14,6 +14,7 @@ from statsmodels.nonparametric.smoothers_lowess import lowess
 mpl.rcParams['pdf.fonttype'] = 42
 
 from plotting.colors import load_color_palette
+from result_sink import load_results
 
 projectdir = os.path.join('E:/', 'Dropbox (IDM)', 'Malaria Team Folder', 'projects', 'atsb')
 datadir = os.path.join(projectdir, 'sim_data')
@@ -22,7 +23,7 @@ plotdir = os.path.join(projectdir, 'sim_plots')
 
 def load_sim_df(data_fname):
 
-    df = pd.read_csv(data_fname)
+    df = load_results(data_fname).drop(columns=['exp_id', 'sim_id'], errors='ignore')
     df = df.groupby(['Site_Name', 'x_Temporary_Larval_Habitat', 'intervention', 'year']).agg(np.mean).reset_index()
 
     df = df.sort_values(by=['Site_Name', 'x_Temporary_Larval_Habitat', 'year'])
@@ -0,0 +1,59 @@
+"""
+Replicate counts from the between-seed variance of a pilot batch.
+
+The number of runs needed for a confidence interval of half-width h on a mean is n = (z * sd / h)^2. sd is estimated per
+group (by default site x intervention x habitat) from the pilot's analyzer output, either of the channel itself or, when
+a baseline arm is given, of the paired difference to it (see paired_analysis), which is what cases averted are computed
+from. Since every simulation covers all sites and the arms at a habitat share their seeds, the runs to schedule at each
+habitat are the largest requirement over its sites, arms and channels.
+"""
+
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+
+from paired_analysis import paired_differences
+
+DEFAULT_TARGETS = {'PfPR2to10': 0.01, 'New_Clinical_Cases': 50}
+
+
+def habitat_key(habitat):
+    """
+    Habitat rounded to 6 significant digits, so values read back from analyzer output and from the burn-in catalog match
+    """
+    return float('%.6g' % habitat)
+
+
+def required_replicates(df, targets=DEFAULT_TARGETS, baseline=None, by=('Site_Name', 'intervention',
+                                                                          'x_Temporary_Larval_Habitat'),
+                        confidence=0.95):
+    """
+    :param df: pilot analyzer output, one row per (simulation, site)
+    :param targets: {channel: confidence interval half-width}
+    :param baseline: baseline arm for paired differences; None to use the channels directly
+    :return: pandas.DataFrame per group with the pilot runs, sd and required runs of each channel and overall
+    """
+    by = list(by)
+    channels = list(targets.keys())
+    if baseline is not None:
+        df = paired_differences(df, baseline, channels).rename(columns={'diff %s' % c: c for c in channels})
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    grouped = df.groupby(by)
+    out = grouped.size().rename('pilot_runs').to_frame()
+    for c, half_width in targets.items():
+        out['sd %s' % c] = grouped[c].std()
+        out['runs %s' % c] = np.ceil((z * out['sd %s' % c] / half_width) ** 2).fillna(0).astype(int)
+    out['required_runs'] = out[['runs %s' % c for c in channels]].max(axis=1)
+    return out.reset_index()
+
+
+def runs_per_habitat(required, min_runs=2, max_runs=40):
+    """
+    Runs to have in total at each habitat: the largest requirement over its sites and arms, clipped to
+    [min_runs, max_runs]
+    :return: dict of habitat_key(x_Temporary_Larval_Habitat) to number of runs
+    """
+    habitats = required['x_Temporary_Larval_Habitat'].map(habitat_key)
+    runs = required.groupby(habitats)['required_runs'].max().clip(min_runs, max_runs)
+    return runs.astype(int).to_dict()
@@ -0,0 +1,175 @@
+"""
+Partial reads of the json reports (InsetChart, MalariaSummaryReport) for analyzers that only need a few of their arrays.
+
+Instead of decoding the whole report, the members of each object on the way to a requested key path, e.g.
+('Channels', 'Adult Vectors', 'Data') or ('DataByTime', 'PfPR_2to10'), are walked and the values of the others skipped:
+flat numeric arrays, which make up most of a report, are jumped over with a single search for their closing bracket.
+Only the requested values are decoded: flat numeric arrays with np.fromstring, anything else (or arrays np.fromstring
+can't read, e.g. holding null or true/false) with json. The result is a
+dict with the same nesting as the report, holding the requested paths only, so analyzers index it as they would the
+parsed report.
+
+Reports can be given as a file name, raw bytes (analyzers constructed with parse=False), or an already parsed dict, in
+which case the paths are just looked up.
+"""
+
+import re
+import json
+import warnings
+import numpy as np
+
+STRUCTURAL = re.compile(rb'["\[\]{}]')
+STRING = re.compile(rb'"(?:[^"\\]|\\.)*"')
+SCALAR = re.compile(rb'[^,}\]\s]+')
+WHITESPACE = re.compile(rb'\s*')
+
+
+def _skip_whitespace(buf, pos):
+    return WHITESPACE.match(buf, pos).end()
+
+
+def _flat_array_end(buf, start):
+    """
+    End of the array opening at start if it holds no nested arrays, objects or strings (e.g. a channel's Data), else None
+    """
+    end = buf.find(b']', start)
+    if end < 0 or any(buf.find(c, start + 1, end) >= 0 for c in (b'[', b'{', b'"')):
+        return None
+    return end + 1
+
+
+def _value_end(buf, start):
+    first = buf[start:start + 1]
+    if first == b'"':
+        return STRING.match(buf, start).end()
+    if first not in (b'{', b'['):
+        return SCALAR.match(buf, start).end()
+
+    depth = 0
+    pos = start
+    while True:
+        m = STRUCTURAL.search(buf, pos)
+        if m is None:
+            raise ValueError('Unterminated json value at byte %d' % start)
+        c = m.group()
+        if c == b'"':
+            pos = STRING.match(buf, m.start()).end()
+            continue
+        if c == b'[':
+            end = _flat_array_end(buf, m.start())
+            if end is not None:
+                if depth == 0:
+                    return end
+                pos = end
+                continue
+        if c in (b'{', b'['):
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return m.end()
+        pos = m.end()
+
+
+def _find_key(buf, obj_start, key):
+    """
+    Walk the members of the object opening at obj_start, skipping over their values
+    :return: position of the value of key
+    """
+    if buf[obj_start:obj_start + 1] != b'{':
+        raise KeyError(key)
+    target = json.dumps(key).encode('utf-8')
+    pos = _skip_whitespace(buf, obj_start + 1)
+    while buf[pos:pos + 1] == b'"':
+        name = STRING.match(buf, pos)
+        pos = _skip_whitespace(buf, name.end())
+        if buf[pos:pos + 1] != b':':
+            raise ValueError('Expected : at byte %d' % pos)
+        pos = _skip_whitespace(buf, pos + 1)
+        token = name.group()
+        if token == target or (b'\\' in token and json.loads(token) == key):
+            return pos
+        pos = _skip_whitespace(buf, _value_end(buf, pos))
+        if buf[pos:pos + 1] == b',':
+            pos = _skip_whitespace(buf, pos + 1)
+    raise KeyError(key)
+
+
+def _decode(text):
+    flat = text[:1] == b'[' and b'[' not in text[1:] and b'{' not in text and b'"' not in text
+    if flat:
+        body = text[1:-1]
+        if not body.strip():
+            return np.array([])
+        try:
+            # older NumPy only warns, and returns the part it could read
+            with warnings.catch_warnings():
+                warnings.simplefilter('error', DeprecationWarning)
+                return np.fromstring(body, sep=',')
+        except (ValueError, DeprecationWarning):
+            pass
+    value = json.loads(text)
+    if flat:
+        try:
+            return np.asarray(value, dtype=float)  # null as nan, true / false as 1 / 0
+        except (TypeError, ValueError):
+            pass
+    return value
+
+
+def _lookup(report, path):
+    value = report
+    for key in path:
+        value = value[key]
+    return np.asarray(value) if isinstance(value, list) else value
+
+
+def _nest(paths, values):
+    out = {}
+    for path, value in zip(paths, values):
+        d = out
+        for key in path[:-1]:
+            d = d.setdefault(key, {})
+        d[path[-1]] = value
+    return out
+
+
+def extract(report, paths):
+    """
+    :param report: file name, raw bytes / str, or parsed dict
+    :param paths: list of key tuples, e.g. [('Header', 'Timesteps'), ('Channels', 'Infected', 'Data')]
+    :return: dict with the report's nesting holding only the values at paths; arrays as NumPy arrays
+    """
+    paths = [tuple(p) for p in paths]
+    if isinstance(report, dict):
+        return _nest(paths, [_lookup(report, path) for path in paths])
+    if isinstance(report, str) and not report.lstrip().startswith('{'):
+        with open(report, 'rb') as f:
+            report = f.read()
+    buf = report.encode('utf-8') if isinstance(report, str) else bytes(report)
+
+    # positions of the objects already walked to, shared between paths with a common prefix
+    starts = {(): _skip_whitespace(buf, 0)}
+    values = []
+    for path in paths:
+        for i in range(1, len(path) + 1):
+            if path[:i] not in starts:
+                starts[path[:i]] = _find_key(buf, starts[path[:i - 1]], path[i - 1])
+        start = starts[path]
+        values.append(_decode(buf[start:_value_end(buf, start)]))
+    return _nest(paths, values)
+
+
+def summary_report(report, channels):
+    """
+    DataByTime channels of a MalariaSummaryReport, as {'DataByTime': {channel: array}}
+    """
+    return extract(report, [('DataByTime', ch) for ch in channels])
+
+
+def inset_chart(report, channels, header=()):
+    """
+    Channels of an InsetChart, as {'Channels': {channel: {'Data': array}}, 'Header': {key: value}}
+    :param header: Header entries to include, e.g. ['Timesteps']
+    """
+    return extract(report, [('Channels', ch, 'Data') for ch in channels] + [('Header', key) for key in header])
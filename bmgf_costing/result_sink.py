@@ -0,0 +1,135 @@
+"""
+Incremental output for the analyzers: each simulation's rows are written to their own file as soon as they are
+selected, in a dataset partitioned by experiment and intervention:
+
+    <dataset_dir>/exp_id=<exp_id>/intervention=<intervention>/<sim_id>.parquet
+
+Files are written under a temporary name and moved into place, so a part that exists is complete. Memory no longer
+grows with the number of simulations, and an analysis that stops part-way can be re-run: simulations whose part
+already exists are filtered out before their output is fetched. finalize only writes manifest.json, listing the parts.
+Every row carries the exp_id and sim_id of its simulation, so experiments analysed under the same name stay separable.
+
+Parquet needs pyarrow (or fastparquet); without either the parts are written as csv.
+"""
+
+import os
+import json
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET = True
+except ImportError:
+    try:
+        import fastparquet  # noqa: F401
+        PARQUET = True
+    except ImportError:
+        PARQUET = False
+
+MANIFEST_FNAME = 'manifest.json'
+
+
+def _clean(value):
+    return str(value).replace(os.sep, '_').replace('/', '_').replace('=', '_')
+
+
+class ResultSink:
+
+    def __init__(self, dataset_dir, partition_cols=('intervention',), fmt=None):
+        """
+        :param partition_cols: simulation tags to partition by, after exp_id; missing tags go to <tag>=0, as in the
+        analyzers' sweep variables
+        :param fmt: 'parquet' or 'csv'; parquet if it can be written
+        """
+        self.dataset_dir = dataset_dir
+        self.partition_cols = list(partition_cols)
+        self.fmt = fmt or ('parquet' if PARQUET else 'csv')
+        if self.fmt not in ['parquet', 'csv']:
+            raise ValueError('Unknown result format %s' % self.fmt)
+
+    def part_fname(self, simulation):
+        dirs = ['exp_id=%s' % simulation.experiment_id] + \
+               ['%s=%s' % (k, _clean(simulation.tags.get(k, 0))) for k in self.partition_cols]
+        return os.path.join(self.dataset_dir, *dirs, '%s.%s' % (simulation.id, self.fmt))
+
+    def done(self, simulation):
+        return os.path.exists(self.part_fname(simulation))
+
+    def write(self, simulation, df):
+        """
+        Write one simulation's rows, with its exp_id and sim_id added as columns
+        :return: the part's file name, to be kept in all_data instead of the rows
+        """
+        df = df.assign(exp_id=str(simulation.experiment_id), sim_id=str(simulation.id))
+        fname = self.part_fname(simulation)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        tmp_fname = fname + '.tmp'
+        if self.fmt == 'parquet':
+            df.to_parquet(tmp_fname, index=False)
+        else:
+            df.to_csv(tmp_fname, index=False)
+        os.replace(tmp_fname, fname)
+        return fname
+
+    def parts(self):
+        """
+        :return: list of {'file' (relative to dataset_dir), 'sim_id', 'exp_id', <partition cols>} for every complete part
+        """
+        parts = []
+        suffix = '.' + self.fmt
+        for root, _, fnames in os.walk(self.dataset_dir):
+            rel_dir = os.path.relpath(root, self.dataset_dir)
+            keys = dict(d.split('=', 1) for d in rel_dir.split(os.sep) if '=' in d)
+            for fname in sorted(fnames):
+                if fname.endswith(suffix):
+                    parts.append(dict(keys, file=os.path.join(rel_dir, fname), sim_id=fname[:-len(suffix)]))
+        return sorted(parts, key=lambda p: p['file'])
+
+    def write_manifest(self):
+        parts = self.parts()
+        manifest = {'format': self.fmt,
+                    'partition_cols': ['exp_id'] + self.partition_cols,
+                    'experiments': sorted(set(p['exp_id'] for p in parts)),
+                    'parts': parts}
+        os.makedirs(self.dataset_dir, exist_ok=True)
+        fname = os.path.join(self.dataset_dir, MANIFEST_FNAME)
+        with open(fname + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(fname + '.tmp', fname)
+        return manifest
+
+
+def load_results(fname, exp_ids=None):
+    """
+    Read an analyzer's output back into one DataFrame
+    :param fname: the dataset directory, or a csv file name; <name>.csv is read from the dataset <name>/ if that exists,
+    so csvs written before the analyzers streamed their output still load
+    :param exp_ids: only read these experiments; all by default
+    """
+    if exp_ids is not None:
+        exp_ids = [str(exp_id) for exp_id in exp_ids]
+    dataset_dir = os.path.splitext(fname)[0] if fname.endswith('.csv') else fname
+    try:
+        with open(os.path.join(dataset_dir, MANIFEST_FNAME)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = None
+    if manifest is None:
+        if os.path.isdir(dataset_dir):
+            # not finalized (yet): read whatever parts are complete
+            fmt = 'parquet' if any(f.endswith('.parquet') for _, _, fs in os.walk(dataset_dir) for f in fs) else 'csv'
+            manifest = {'format': fmt, 'parts': ResultSink(dataset_dir, fmt=fmt).parts()}
+        else:
+            df = pd.read_csv(fname)
+            if exp_ids is not None and 'exp_id' in df.columns:
+                df = df[df['exp_id'].astype(str).isin(exp_ids)].reset_index(drop=True)
+            return df
+
+    read = pd.read_parquet if manifest['format'] == 'parquet' else pd.read_csv
+    parts = [p for p in manifest['parts'] if exp_ids is None or p['exp_id'] in exp_ids]
+    # parts written before the ids were stored as columns get them back from their path
+    frames = [read(os.path.join(dataset_dir, p['file'])).assign(**{k: p[k] for k in ['exp_id', 'sim_id']})
+              for p in parts]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames).reset_index(drop=True)
@@ -1,16 +1,22 @@
 from simtools.Managers.WorkItemManager import WorkItemManager
 from simtools.SetupParser import SetupParser
 from simtools.AssetManager.FileList import FileList
+from site_registry import SiteRegistry
 
 wi_name = "ATSB cost impact analysis HS v2"
 command = "python run_analysis.py"
 user_files = FileList(root='analyzers')
-user_files.add_file("../../malaria-toolbox/sim_output_processing/spatial_output_dataframe.py")
+user_files.add_file("spatial_reports.py")
+user_files.add_file("result_sink.py")
+user_files.add_file("report_json.py")
 user_files.add_file("site_details.csv")
+user_files.add_file("site_registry.py")
 
 if __name__ == "__main__":
     SetupParser.default_block = 'HPC'
     SetupParser.init()
 
+    # refresh the registry cache so the analyzers on the work item don't need to re-parse the site csvs
+    user_files.add_file(SiteRegistry().cache_fname)
     wim = WorkItemManager(item_name=wi_name, command=command, user_files=user_files)
     wim.execute(True)
\ No newline at end of file
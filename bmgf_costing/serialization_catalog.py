@@ -0,0 +1,282 @@
+"""
+Local SQLite catalog of serialized burn-in populations, shared between projects.
+
+Each burn-in simulation is recorded once with its site label, x_Temporary_Larval_Habitat, Run_Number and output path,
+together with the state files it wrote (name, size and serialization timestep). Pickup experiments can then be
+assembled from the catalog without going back to COMPS or listing output directories on the network share.
+
+The catalog also keeps equilibrium statistics of each burn-in per site (PfPR2to10 and annual EIR from the site's
+MalariaSummaryReport, adult vectors from SpatialReport_Adult_Vectors.bin when it was written), so that a pickup can be
+chosen by the baseline transmission it should start from (nearest) rather than by habitat value, and new sites or
+intervention sets can reuse existing burn-ins.
+"""
+
+import os
+import re
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from simtools.Utilities.Experiments import retrieve_experiment
+from spatial_reports import decode_spatial_report
+
+DEFAULT_CATALOG = os.path.join(os.path.expanduser('~'), '.atsb', 'serialization_catalog.sqlite')
+
+STATE_FILE_PATTERN = re.compile(r'state-(\d+)')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS simulations (
+    sim_id TEXT PRIMARY KEY,
+    exp_id TEXT,
+    site TEXT,
+    habitat REAL,
+    run_number INTEGER,
+    outpath TEXT,
+    tags TEXT
+);
+CREATE INDEX IF NOT EXISTS simulations_key ON simulations (site, habitat, run_number);
+CREATE INDEX IF NOT EXISTS simulations_exp ON simulations (exp_id);
+CREATE TABLE IF NOT EXISTS equilibrium (
+    sim_id TEXT,
+    site_name TEXT,
+    pfpr REAL,
+    eir REAL,
+    vectors REAL,
+    PRIMARY KEY (sim_id, site_name)
+);
+CREATE INDEX IF NOT EXISTS equilibrium_site ON equilibrium (site_name, pfpr);
+CREATE TABLE IF NOT EXISTS equilibrium_scans (
+    sim_id TEXT PRIMARY KEY,
+    num_sites INTEGER
+);
+CREATE TABLE IF NOT EXISTS state_files (
+    sim_id TEXT,
+    filename TEXT,
+    size INTEGER,
+    timestep INTEGER,
+    PRIMARY KEY (sim_id, filename)
+);
+"""
+
+
+def scan_state_files(outpath):
+    """
+    :param outpath: simulation directory
+    :return: list of (filename, size, timestep) for the state files in its output folder
+    """
+    files = []
+    with os.scandir(os.path.join(outpath, 'output')) as entries:
+        for entry in entries:
+            match = STATE_FILE_PATTERN.search(entry.name)
+            if match:
+                files.append((entry.name, entry.stat().st_size, int(match.group(1))))
+    return sorted(files)
+
+
+def _last_full_year(values):
+    # the last summary report interval is usually cut short by the end of the simulation
+    return float(values[-2] if len(values) > 1 else values[-1]) if len(values) else np.nan
+
+
+def _spatial_node_means(fname, num_steps=365):
+    """
+    Mean of a SpatialReport channel over its last num_steps time steps, by node id
+    """
+    node_ids, data = decode_spatial_report(fname)
+    return dict(zip(node_ids.tolist(), data[-num_steps:].mean(axis=0).tolist()))
+
+
+def equilibrium_stats(outpath, site_names, nodeids=None):
+    """
+    :param outpath: burn-in simulation directory
+    :param site_names: sites with a MalariaSummaryReport_<site>.json in the output folder
+    :param nodeids: dict of site name to node id, to read adult vectors from the spatial report
+    :return: list of (site_name, pfpr, eir, vectors)
+    """
+    output = os.path.join(outpath, 'output')
+    vectors = {}
+    vector_fname = os.path.join(output, 'SpatialReport_Adult_Vectors.bin')
+    if nodeids and os.path.exists(vector_fname):
+        vectors = _spatial_node_means(vector_fname)
+
+    stats = []
+    for site_name in site_names:
+        fname = os.path.join(output, 'MalariaSummaryReport_%s.json' % site_name)
+        if not os.path.exists(fname):
+            continue
+        with open(fname) as f:
+            by_time = json.load(f)['DataByTime']
+        stats.append((site_name, _last_full_year(by_time.get('PfPR_2to10', [])),
+                      _last_full_year(by_time.get('Annual EIR', [])),
+                      vectors.get((nodeids or {}).get(site_name), np.nan)))
+    return stats
+
+
+class SerializationCatalog:
+
+    def __init__(self, db_fname=DEFAULT_CATALOG):
+        os.makedirs(os.path.dirname(os.path.abspath(db_fname)), exist_ok=True)
+        self.db_fname = db_fname
+        self.conn = sqlite3.connect(db_fname)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def has_experiment(self, exp_id):
+        return self.conn.execute('SELECT 1 FROM simulations WHERE exp_id = ? LIMIT 1', (str(exp_id),)).fetchone() is not None
+
+    def add_simulations(self, df, site, exp_id=None, num_workers=16):
+        """
+        Record burn-in simulations and scan their state files
+        :param df: one row per simulation with 'sim_id' and 'outpath' columns plus tags, including
+        x_Temporary_Larval_Habitat and Run_Number
+        :param site: site label the burn-in was run for, e.g. 'all' for the multi-site inputs or 'Kangaba'
+        :param exp_id: burn-in experiment id
+        :param num_workers: threads used to scan output directories
+        """
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            state_files = list(executor.map(scan_state_files, df['outpath']))
+
+        tag_columns = [c for c in df.columns if c not in ('sim_id', 'outpath')]
+        sims = [(str(row['sim_id']), str(exp_id) if exp_id else None, site,
+                 float(row['x_Temporary_Larval_Habitat']), int(row.get('Run_Number', 0)), row['outpath'],
+                 json.dumps({c: row[c] for c in tag_columns}, default=str))
+                for _, row in df.iterrows()]
+        files = [(sim[0], name, size, timestep) for sim, sim_files in zip(sims, state_files)
+                 for name, size, timestep in sim_files]
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO simulations VALUES (?, ?, ?, ?, ?, ?, ?)', sims)
+            self.conn.executemany('DELETE FROM state_files WHERE sim_id = ?', [(sim[0],) for sim in sims])
+            self.conn.executemany('INSERT INTO state_files VALUES (?, ?, ?, ?)', files)
+        return len(sims)
+
+    def add_experiment(self, exp_id, site, num_workers=16):
+        """
+        Record every simulation of a burn-in experiment; this is the only step that talks to COMPS
+        """
+        expt = retrieve_experiment(exp_id)
+        df = pd.DataFrame([sim.tags for sim in expt.simulations])
+        df['sim_id'] = [sim.id for sim in expt.simulations]
+        df['outpath'] = [sim.get_path() for sim in expt.simulations]
+        return self.add_simulations(df, site, exp_id=exp_id, num_workers=num_workers)
+
+    def lookup(self, site=None, exp_id=None, habitat=None, run_number=None, timestep=None):
+        """
+        Serialized populations matching the given keys, one row per simulation
+        :param habitat: x_Temporary_Larval_Habitat; matched to a relative tolerance of 1e-6
+        :param timestep: serialization timestep; defaults to each simulation's last one
+        :return: pandas.DataFrame with sim_id, exp_id, site, x_Temporary_Larval_Habitat, Run_Number, outpath,
+        timestep, state_files (list of names) and state_bytes
+        """
+        clauses, params = [], []
+        for column, value in [('s.site', site), ('s.exp_id', exp_id), ('s.run_number', run_number),
+                              ('f.timestep', timestep)]:
+            if value is not None:
+                clauses.append('%s = ?' % column)
+                params.append(value if column != 's.exp_id' else str(value))
+        query = ('SELECT s.sim_id, s.exp_id, s.site, s.habitat AS x_Temporary_Larval_Habitat, '
+                 's.run_number AS Run_Number, s.outpath, f.timestep, f.filename, f.size '
+                 'FROM simulations s JOIN state_files f ON s.sim_id = f.sim_id')
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        df = pd.read_sql_query(query, self.conn, params=params)
+
+        if habitat is not None:
+            df = df[np.isclose(df['x_Temporary_Larval_Habitat'], habitat, rtol=1e-6, atol=0)]
+        if timestep is None and len(df):
+            df = df[df['timestep'] == df.groupby('sim_id')['timestep'].transform('max')]
+
+        keys = ['sim_id', 'exp_id', 'site', 'x_Temporary_Larval_Habitat', 'Run_Number', 'outpath', 'timestep']
+        grouped = df.groupby(keys, sort=False)
+        out = grouped['filename'].agg(list).rename('state_files').to_frame()
+        out['state_bytes'] = grouped['size'].sum()
+        return out.reset_index().sort_values(by=['site', 'x_Temporary_Larval_Habitat', 'Run_Number'])\
+            .reset_index(drop=True)
+
+    def add_equilibrium(self, site_names, nodeids=None, exp_id=None, num_workers=16):
+        """
+        Record equilibrium statistics of the catalogued burn-ins that don't have them yet
+        :param site_names: site names, as used in the burn-ins' summary report descriptions
+        :param nodeids: dict of site name to node id for adult vector counts, e.g. SiteRegistry().nodeids()
+        :param exp_id: restrict to one burn-in experiment
+        :return: number of simulations scanned
+        """
+        # simulations scanned before are skipped, including those that had none of the sites' reports
+        query = ('SELECT sim_id, outpath FROM simulations '
+                 'WHERE sim_id NOT IN (SELECT sim_id FROM equilibrium_scans) '
+                 'AND sim_id NOT IN (SELECT DISTINCT sim_id FROM equilibrium)')
+        params = []
+        if exp_id is not None:
+            query += ' AND exp_id = ?'
+            params.append(str(exp_id))
+        sims = self.conn.execute(query, params).fetchall()
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            stats = list(executor.map(lambda sim: equilibrium_stats(sim[1], site_names, nodeids), sims))
+        rows = [(sim[0],) + site_stats for sim, sim_stats in zip(sims, stats) for site_stats in sim_stats]
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO equilibrium VALUES (?, ?, ?, ?, ?)', rows)
+            self.conn.executemany('INSERT OR REPLACE INTO equilibrium_scans VALUES (?, ?)',
+                                  [(sim[0], len(sim_stats)) for sim, sim_stats in zip(sims, stats)])
+        return len(sims)
+
+    def equilibrium(self, site_name=None):
+        """
+        :return: pandas.DataFrame of sim_id, site_name, pfpr, eir and vectors
+        """
+        query = 'SELECT sim_id, site_name, pfpr, eir, vectors FROM equilibrium'
+        params = []
+        if site_name is not None:
+            query += ' WHERE site_name = ?'
+            params.append(site_name)
+        return pd.read_sql_query(query, self.conn, params=params)
+
+    def nearest(self, site_name, target_pfprs, exp_id, run_number=0, max_distance=None, **lookup_kwargs):
+        """
+        Serialized populations whose equilibrium PfPR2to10 at a site is closest to each target
+        :param site_name: site the baseline PfPR refers to
+        :param target_pfprs: baseline PfPR2to10 values to start from
+        :param exp_id: burn-in experiment to pick from; burn-ins of other experiments (other configs, sites or input
+        files) are never mixed in, however close their PfPR
+        :param run_number: burn-in Run_Number to use
+        :param max_distance: drop targets with no burn-in within this absolute PfPR distance
+        :param lookup_kwargs: passed to lookup, e.g. site
+        :return: lookup() rows, one per target (in target order) with target_pfpr, pfpr, eir and vectors columns
+        """
+        site_eq = self.equilibrium(site_name)
+        if not len(site_eq):
+            raise ValueError('No equilibrium statistics for site %s; the burn-ins have no MalariaSummaryReport_%s.json '
+                             'or add_equilibrium has not been run' % (site_name, site_name))
+        states = self.lookup(exp_id=exp_id, run_number=run_number, **lookup_kwargs)
+        eq = pd.merge(states, site_eq, on='sim_id').dropna(subset=['pfpr'])
+        eq = eq.sort_values(by='pfpr').reset_index(drop=True)
+        if not len(eq):
+            raise ValueError('No serialized burn-in with equilibrium statistics for site %s matches %s'
+                             % (site_name, dict(lookup_kwargs, exp_id=exp_id, run_number=run_number)))
+
+        targets = np.asarray(target_pfprs, dtype=float)
+        pfprs = eq['pfpr'].to_numpy()
+        right = np.clip(np.searchsorted(pfprs, targets), 0, len(pfprs) - 1)
+        left = np.maximum(right - 1, 0)
+        idx = np.where(np.abs(pfprs[left] - targets) <= np.abs(pfprs[right] - targets), left, right)
+
+        out = eq.iloc[idx].reset_index(drop=True)
+        out.insert(0, 'target_pfpr', targets)
+        if max_distance is not None:
+            out = out[np.abs(out['pfpr'] - out['target_pfpr']) <= max_distance].reset_index(drop=True)
+        return out
+
+    def state_files(self, df):
+        """
+        dict of outpath to state file names for a lookup() result, in the form used by sweep_builders.burnin_pickup_fns
+        """
+        return dict(zip(df['outpath'], df['state_files']))
@@ -0,0 +1,136 @@
+"""
+Single access point for the site-level inputs shared by the simulation builders and analyzers: site_details.csv,
+sites/all/vector_proportions.csv and species_details.json.
+
+The parsed tables are kept in a versioned NumPy cache (site_registry.npz, no pickled objects) next to site_details.csv.
+The cache is reused while the size and mtime of every source file match, or failing that, their content hashes; otherwise
+it is rebuilt from the sources. Lookups by site name and by nodeid are dict-backed.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+CACHE_VERSION = 1
+SITE_COLUMNS = ['name', 'lat', 'lon', 'cluster', 'country', 'birth_rate_country', 'continent', 'nodeid']
+
+
+def _file_signature(fname):
+    stat = os.stat(fname)
+    with open(fname, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha1': digest}
+
+
+class SiteRegistry:
+
+    def __init__(self, site_details_fname='site_details.csv',
+                 vector_props_fname=os.path.join('sites', 'all', 'vector_proportions.csv'),
+                 species_details_fname='species_details.json', cache_fname=None):
+        self.sources = {'site_details': site_details_fname,
+                        'vector_proportions': vector_props_fname,
+                        'species_details': species_details_fname}
+        self.cache_fname = cache_fname or os.path.join(os.path.dirname(site_details_fname) or '.',
+                                                       'site_registry.npz')
+        arrays = self._load_cache()
+        if arrays is None:
+            arrays = self._build()
+            self._save_cache(arrays)
+
+        self.sites = pd.DataFrame({col: arrays['site_%s' % col] for col in SITE_COLUMNS})
+        self.species = arrays['species'].tolist()
+        self.vector_proportions = arrays['vector_proportions']
+        self.species_details = json.loads(str(arrays['species_details']))
+
+        self._by_name = {name: i for i, name in enumerate(self.sites['name'].tolist())}
+        self._by_nodeid = {nodeid: i for i, nodeid in enumerate(self.sites['nodeid'].tolist())}
+
+    def _save_cache(self, arrays):
+        # written next to the cache and moved into place, so an interrupted write never leaves a truncated cache
+        tmp_fname = self.cache_fname + '.tmp'
+        with open(tmp_fname, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_fname, self.cache_fname)
+
+    def _load_cache(self):
+        # any unreadable cache (missing, truncated, from another version) is a cache miss
+        try:
+            with np.load(self.cache_fname, allow_pickle=False) as cache:
+                arrays = {k: cache[k] for k in cache.files}
+            if int(arrays.get('version', -1)) != CACHE_VERSION:
+                return None
+            cached = json.loads(str(arrays['signatures']))
+        except Exception:
+            return None
+
+        for key, fname in self.sources.items():
+            if not os.path.exists(fname):
+                continue  # e.g. on a work item shipped with the cache only
+            stat = os.stat(fname)
+            if (stat.st_size, stat.st_mtime_ns) == (cached[key]['size'], cached[key]['mtime']):
+                continue
+            if _file_signature(fname)['sha1'] != cached[key]['sha1']:
+                return None
+        return arrays
+
+    def _build(self):
+        sites = pd.read_csv(self.sources['site_details'])
+        vectors = pd.read_csv(self.sources['vector_proportions']).set_index('node_id')
+        with open(self.sources['species_details']) as f:
+            species_details = json.load(f)
+
+        species = [c for c in vectors.columns if c != 'name']
+        missing = sorted(set(sites['nodeid']) - set(vectors.index))
+        extra = sorted(set(vectors.index) - set(sites['nodeid']))
+        if missing or extra:
+            raise ValueError('Node ids of %s and %s differ: missing vector proportions for %s, no site for %s'
+                             % (self.sources['site_details'], self.sources['vector_proportions'], missing, extra))
+        vectors = vectors.loc[sites['nodeid'], species]
+
+        arrays = {'site_%s' % col: sites[col].to_numpy() if pd.api.types.is_numeric_dtype(sites[col])
+                  else sites[col].astype(str).to_numpy(dtype=str)
+                  for col in SITE_COLUMNS}
+        arrays.update({'version': np.array(CACHE_VERSION),
+                       'signatures': np.array(json.dumps({k: _file_signature(f) for k, f in self.sources.items()})),
+                       'species': np.array(species, dtype=str),
+                       'vector_proportions': vectors.to_numpy(dtype=float),
+                       'species_details': np.array(json.dumps(species_details))})
+        return arrays
+
+    def __len__(self):
+        return len(self.sites)
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    @property
+    def names(self):
+        return self.sites['name'].tolist()
+
+    def nodeid(self, name):
+        return int(self.sites['nodeid'].values[self._by_name[name]])
+
+    def name(self, nodeid):
+        return self.sites['name'].values[self._by_nodeid[int(nodeid)]]
+
+    def site(self, name):
+        return self.sites.iloc[self._by_name[name]].to_dict()
+
+    def nodeids(self, names=None):
+        """
+        :param names: site names; defaults to all sites in site_details order
+        :return: dict of site name to nodeid
+        """
+        names = self.names if names is None else names
+        return {name: self.nodeid(name) for name in names}
+
+    def vector_props(self):
+        """
+        vector_proportions.csv as a DataFrame (name, node_id and one column per species) in site_details order
+        """
+        df = pd.DataFrame(self.vector_proportions, columns=self.species)
+        df.insert(0, 'node_id', self.sites['nodeid'].to_numpy())
+        df.insert(0, 'name', self.sites['name'].to_numpy())
+        return df
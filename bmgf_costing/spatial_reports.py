@@ -0,0 +1,89 @@
+"""
+SpatialReport_<channel>.bin as NumPy arrays.
+
+The file is a header of two int32 (number of nodes, number of time steps) and the node ids as int32, followed by float32
+data in time-major order, so a channel is a single (time x node) view of the buffer. Several channels are stacked into
+one (channel x time x node) array, over which per-site sums and means are plain axis reductions.
+
+Channels can be given as file names, raw bytes, or the dicts simtools' analysis workers produce for SpatialReport files
+({'n_nodes', 'n_tstep', 'nodeids', 'data'}). When the simulation outputs are reachable on disk (e.g. on an SSMT work
+item), read_spatial_reports takes a node subset and a time window and memory-maps the files, so only the pages holding
+the requested time steps are read.
+"""
+
+import os
+import numpy as np
+
+HEADER_DTYPE = '<i4'
+DATA_DTYPE = '<f4'
+
+
+def decode_spatial_report(report):
+    """
+    :param report: file name, bytes, or simtools SpatialOutput dict
+    :return: (node ids array, (time x node) float32 array)
+    """
+    if isinstance(report, dict):
+        return np.asarray(report['nodeids']), np.asarray(report['data'], dtype=np.float32)
+    if isinstance(report, str):
+        report = np.fromfile(report, dtype=np.uint8)
+    buf = memoryview(report).cast('B')
+    num_nodes, num_times = np.frombuffer(buf, dtype=HEADER_DTYPE, count=2)
+    node_ids = np.frombuffer(buf, dtype=HEADER_DTYPE, count=num_nodes, offset=8)
+    data = np.frombuffer(buf, dtype=DATA_DTYPE, count=num_nodes * num_times, offset=8 + 4 * int(num_nodes))
+    return node_ids, data.reshape(num_times, num_nodes)
+
+
+def stack_spatial_reports(reports):
+    """
+    :param reports: one report per channel, in any form accepted by decode_spatial_report
+    :return: (node ids array, (channel x time x node) array)
+    """
+    decoded = [decode_spatial_report(report) for report in reports]
+    node_ids = decoded[0][0]
+    for ids, data in decoded[1:]:
+        if not np.array_equal(ids, node_ids) or data.shape != decoded[0][1].shape:
+            raise ValueError('Spatial reports cover different nodes or time steps')
+    return node_ids, np.stack([data for _, data in decoded])
+
+
+def node_columns(node_ids, nodes):
+    """
+    Column index of each requested node id in a report's node axis
+    """
+    lookup = {int(n): i for i, n in enumerate(node_ids)}
+    try:
+        return np.array([lookup[int(n)] for n in nodes], dtype=int)
+    except KeyError as e:
+        raise KeyError('Node %s not in spatial report' % e.args[0])
+
+
+def read_spatial_report(fname, nodes=None, times=None):
+    """
+    Read part of a SpatialReport file without loading the rest
+    :param fname: SpatialReport_<channel>.bin
+    :param nodes: node ids to keep, in this order; defaults to all nodes
+    :param times: slice of time steps to keep; defaults to all
+    :return: (node ids array, (time x node) float32 array)
+    """
+    with open(fname, 'rb') as f:
+        num_nodes, num_times = np.fromfile(f, dtype=HEADER_DTYPE, count=2)
+        node_ids = np.fromfile(f, dtype=HEADER_DTYPE, count=num_nodes)
+    data = np.memmap(fname, dtype=DATA_DTYPE, mode='r', offset=8 + 4 * int(num_nodes),
+                     shape=(int(num_times), int(num_nodes)))
+    window = data[times if times is not None else slice(None)]
+    if nodes is not None:
+        cols = node_columns(node_ids, nodes)
+        return node_ids[cols], np.asarray(window[:, cols])
+    return node_ids, np.array(window)
+
+
+def read_spatial_reports(output_dir, channels, nodes=None, times=None):
+    """
+    read_spatial_report for several channels of one simulation
+    :param output_dir: simulation output folder
+    :return: (node ids array, (channel x time x node) array)
+    """
+    decoded = [read_spatial_report(os.path.join(output_dir, 'SpatialReport_%s.bin' % ch), nodes, times)
+               for ch in channels]
+    return decoded[0][0], np.stack([data for _, data in decoded])
@@ -0,0 +1,127 @@
+"""
+Builders for large experiment sweeps. Mod lists are produced by generators so that ModBuilder.from_list can consume
+them lazily, and filesystem lookups against the burn-in outputs are done once per directory.
+
+Very large sweeps can be split into shards of a fixed number of simulations, each submitted as its own experiment as
+soon as it has been enumerated, so only one shard of mod lists is held in memory and the first shard starts running
+before the rest of the sweep exists.
+"""
+
+import os
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from dtk.utils.core.DTKConfigBuilder import DTKConfigBuilder
+from simtools.ExperimentManager.ExperimentManagerFactory import ExperimentManagerFactory
+from simtools.ModBuilder import ModBuilder, ModFn
+
+from replicate_tuning import habitat_key
+
+
+def list_serialized_files(outpaths, num_workers=16):
+    """
+    List the serialized population files of each burn-in simulation once
+    :param outpaths: simulation directories (sim.get_path()); duplicates are listed once
+    :param num_workers: threads used for the listings, which are dominated by network-share latency
+    :return: dict of simulation directory to sorted list of state file names in its output folder
+    """
+    outpaths = list(dict.fromkeys(outpaths))
+
+    def state_files(outpath):
+        return sorted(name for name in os.listdir(os.path.join(outpath, 'output')) if 'state' in name)
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        return dict(zip(outpaths, executor.map(state_files, outpaths)))
+
+
+def burnin_pickup_fns(burnin_df, num_runs, state_files=None, first_run=0):
+    """
+    Generate one ModFn per (burn-in simulation, Run_Number) that picks up from the burn-in's serialized population
+    :param burnin_df: burn-in simulation tags with an 'outpath' column, one row per serialized population to reuse
+    :param num_runs: Run_Numbers first_run..num_runs-1 are generated for each burn-in; either a number or a dict of
+    habitat_key(x_Temporary_Larval_Habitat) to number (see replicate_tuning.runs_per_habitat), which must cover every
+    burn-in habitat
+    :param state_files: output of list_serialized_files; listed here if not given
+    """
+    if state_files is None:
+        state_files = list_serialized_files(burnin_df['outpath'])
+
+    for outpath, habitat in zip(burnin_df['outpath'], burnin_df['x_Temporary_Larval_Habitat']):
+        if isinstance(num_runs, dict):
+            if habitat_key(habitat) not in num_runs:
+                raise ValueError('No number of runs for burn-in habitat %s' % habitat)
+            runs = num_runs[habitat_key(habitat)]
+        else:
+            runs = num_runs
+        for run_num in range(first_run, runs):
+            yield ModFn(DTKConfigBuilder.update_params, {
+                "Serialized_Population_Path": os.path.join(outpath, "output"),
+                "Serialized_Population_Filenames": list(state_files[outpath]),
+                "Run_Number": run_num,
+                "x_Temporary_Larval_Habitat": habitat})
+
+
+def mod_product(*axes):
+    """
+    Lazily generate the cross product of sweep axes as mod lists for ModBuilder.from_list
+    :param axes: iterables of ModFn (or of lists of ModFn); every ModFn is built once per axis value and shared by all
+    the simulations that use it
+    :return: generator of mod lists, the last axis varying fastest
+    """
+    for combination in itertools.product(*axes):
+        mods = []
+        for mod in combination:
+            mods += mod if isinstance(mod, (list, tuple)) else [mod]
+        yield mods
+
+
+def chunked(iterable, size):
+    """
+    Yield lists of at most size items from an iterable without enumerating it first
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_sharded(cb, exp_name, mod_lists, shard_size=10000):
+    """
+    Submit a sweep as consecutive experiments of at most shard_size simulations each
+    :param cb: base config builder
+    :param exp_name: experiment name; shards are named <exp_name>_000, <exp_name>_001, ...
+    :param mod_lists: iterable of mod lists, e.g. from mod_product or burnin_pickup_fns
+    :return: list of experiment managers, one per shard
+    """
+    managers = []
+    for shard, mods in enumerate(chunked(mod_lists, shard_size)):
+        print('submitting shard %d (%d simulations)' % (shard, len(mods)))
+        em = ExperimentManagerFactory.from_cb(cb)
+        em.run_simulations(config_builder=cb,
+                           exp_name='%s_%03d' % (exp_name, shard),
+                           exp_builder=ModBuilder.from_list(mods))
+        managers.append(em)
+    return managers
+
+
+def tag_pair(cb, pair_id):
+    return {'CRN_Pair': pair_id}
+
+
+def paired_arm_fns(pickup_fns, arm_fns, first_pair=0):
+    """
+    Common random numbers across intervention arms: every arm is run from each pickup point (same serialized burn-in and
+    Run_Number), and all the simulations of a point share a CRN_Pair tag for paired analysis
+    :param pickup_fns: one ModFn per (burn-in, Run_Number), e.g. from burnin_pickup_fns
+    :param arm_fns: one ModFn per intervention arm
+    :param first_pair: CRN_Pair of the first pickup point, so that batches submitted separately (e.g. a pilot and its
+    follow-up) don't reuse each other's pair ids
+    :return: generator of mod lists, arms varying fastest
+    """
+    arm_fns = list(arm_fns)
+    for pair_id, pickup_fn in enumerate(pickup_fns, start=first_pair):
+        pair_fn = ModFn(tag_pair, pair_id)
+        for arm_fn in arm_fns:
+            yield [pickup_fn, arm_fn, pair_fn]
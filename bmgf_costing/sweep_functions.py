@@ -12,6 +12,7 @@ from dtk.interventions.irs import add_IRS
 from dtk.interventions.itn_age_season import add_ITN_age_season
 from dtk.interventions.property_change import change_individual_property
 from dtk.interventions.novel_vector_control import add_ATSB
+from atsb_configs import kill_configs, killing_table
 
 from malaria.interventions.malaria_drug_campaigns import add_drug_campaign
 
@@ -43,8 +44,6 @@ def simulation_setup(cb, species_details, site_vector_props, max_larval_capacity
     # Find vector proportions for each vector
     set_params_by_species(cb.params, [name for name in species_details.keys()])
 
-    larval_habs_per_site = {"NodeID": site_vector_props["node_id"]}
-
     for species_name, species_modifications in species_details.items():
         set_species_param(cb, species_name, "Adult_Life_Expectancy", 20)
         set_species_param(cb, species_name, 'Vector_Sugar_Feeding_Frequency', 'VECTOR_SUGAR_FEEDING_EVERY_DAY')
@@ -53,12 +52,30 @@ def simulation_setup(cb, species_details, site_vector_props, max_larval_capacity
             if param == "habitat_split":
                 new_vals = {hab: hab_prop * max_larval_capacity for hab, hab_prop in val.items()}
                 set_species_param(cb, species_name, "Larval_Habitat_Types", new_vals)
-                larval_habs_per_site.update({".".join([species_name, hab]): site_vector_props[species_name]
-                                             for hab in val.keys()})
             else:
                 set_species_param(cb, species_name, param, val)
 
-    scale_larval_habitats(cb, pd.DataFrame(larval_habs_per_site))
+    scale_larval_habitats(cb, larval_habitat_scales(species_details, site_vector_props))
+
+
+def larval_habitat_scales(species_details, site_vector_props):
+    """
+    Per-node larval habitat scale factors in the format expected by scale_larval_habitats: a NodeID column plus one
+    species.habitat column per habitat in each species' habitat_split, holding that species' proportion at the node.
+    :param species_details: species_details.json contents
+    :param site_vector_props: vector_proportions.csv as a DataFrame with a node_id column and one column per species
+    :return: pandas.DataFrame of shape (nodes x 1 + species.habitat pairs)
+    """
+    species = [sp for sp, details in species_details.items() if "habitat_split" in details]
+    habitats = [(sp, hab) for sp in species for hab in species_details[sp]["habitat_split"].keys()]
+
+    # (nodes x species) -> (nodes x species.habitat) in a single gather
+    props = site_vector_props[species].to_numpy(dtype=float)
+    scales = props[:, [species.index(sp) for sp, _ in habitats]]
+
+    df = pd.DataFrame(scales, columns=[".".join(h) for h in habitats])
+    df.insert(0, "NodeID", site_vector_props["node_id"].to_numpy())
+    return df
 
 
 # itns
@@ -101,14 +118,11 @@ def add_irs_group(cb, coverage=1.0, start_days=[0], decay=270):
 
 
 # atsb
-def add_atsb_by_coverage(cb, coverage=1, killing = 0.0337, species_list=[]):
+def add_atsb_by_coverage(cb, coverage=1, killing = 0.0337, species_list=[], start=5):
 
-    add_ATSB(cb, start = 5,
+    add_ATSB(cb, start = start,
              coverage = coverage,
-             kill_cfg = [{ 'Species' : sp,
-                           'Killing_Config' : {"class": 'WaningEffectConstant',
-                                               "Initial_Effect": killing }
-                           } for sp in species_list],
+             kill_cfg = kill_configs(killing_table(species_list, 'Constant', Initial_Effect=killing)),
              duration=3*365)
     return {'atsb_coverage': coverage}
 
@@ -0,0 +1,165 @@
+"""
+Local manifest of completed sweep points, so that re-running a sweep (e.g. with one more intervention) only submits the
+points that haven't run yet.
+
+A point is hashed from its tags and from what its mods change relative to the base config builder: the config
+parameters they add or modify and the campaign events they add. The base config and campaign are hashed too, so any
+change to the shared setup invalidates every point. Submitted simulations carry their hash in the 'point_hash' tag;
+add_experiment reads it back from COMPS and records succeeded simulations with their output paths.
+"""
+
+import os
+import copy
+import json
+import hashlib
+import sqlite3
+from collections import Counter
+import pandas as pd
+
+from COMPS.Data.Simulation import SimulationState
+from simtools.ModBuilder import ModFn
+from simtools.Utilities.Experiments import retrieve_experiment
+
+DEFAULT_MANIFEST = os.path.join(os.path.expanduser('~'), '.atsb', 'sweep_manifest.sqlite')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS points (
+    point_hash TEXT PRIMARY KEY,
+    sweep TEXT,
+    exp_id TEXT,
+    sim_id TEXT,
+    outpath TEXT,
+    tags TEXT
+);
+CREATE INDEX IF NOT EXISTS points_sweep ON points (sweep);
+"""
+
+
+def _canonical(obj):
+    def default(o):
+        if hasattr(o, 'to_json'):
+            return json.loads(o.to_json())
+        if hasattr(o, 'tolist'):
+            return o.tolist()
+        return str(o)
+    return json.dumps(obj, sort_keys=True, default=default)
+
+
+def _sha1(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def base_hash(cb):
+    """
+    Hash of the base config parameters and campaign events
+    """
+    return _sha1(_canonical({'config': cb.params, 'campaign': cb.campaign.Events}))
+
+
+def point_hash(cb, mods, base=None):
+    """
+    Hash one sweep point
+    :param cb: base config builder; left unchanged
+    :param mods: the point's list of ModFn
+    :param base: base_hash(cb), when hashing many points
+    :return: (hash, tags)
+    """
+    point = copy.deepcopy(cb)
+    tags = {}
+    for mod in mods:
+        tags.update(mod(point) or {})
+
+    config_diff = {k: v for k, v in point.params.items() if k not in cb.params or cb.params[k] != v}
+    added_events = Counter(_canonical(e) for e in point.campaign.Events)
+    added_events.subtract(_canonical(e) for e in cb.campaign.Events)
+    campaign_diff = sorted(e for e, n in added_events.items() for _ in range(max(n, 0)))
+
+    return _sha1(_canonical({'base': base or base_hash(cb), 'tags': tags, 'config': config_diff,
+                             'campaign': campaign_diff})), tags
+
+
+def tag_point(cb, point_hash):
+    return {'point_hash': point_hash}
+
+
+def tag_points(cb, mod_lists, skip=()):
+    """
+    Add a ModFn tagging each point with its point_hash, so that add_experiment can record it once it has run
+    :param cb: base config builder, fully set up apart from the swept mods
+    :param mod_lists: iterable of mod lists; consumed lazily
+    :param skip: point hashes to leave out of the sweep
+    :return: generator of tagged mod lists
+    """
+    base = base_hash(cb)
+    skipped = 0
+    for mods in mod_lists:
+        h, _ = point_hash(cb, mods, base)
+        if h in skip:
+            skipped += 1
+            continue
+        yield list(mods) + [ModFn(tag_point, h)]
+    if skip:
+        print('skipped %d completed sweep points' % skipped)
+
+
+class SweepManifest:
+
+    def __init__(self, db_fname=DEFAULT_MANIFEST):
+        os.makedirs(os.path.dirname(os.path.abspath(db_fname)), exist_ok=True)
+        self.db_fname = db_fname
+        self.conn = sqlite3.connect(db_fname)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def completed(self, sweep=None):
+        """
+        :return: set of completed point hashes, optionally for one sweep name only
+        """
+        if sweep is None:
+            rows = self.conn.execute('SELECT point_hash FROM points')
+        else:
+            rows = self.conn.execute('SELECT point_hash FROM points WHERE sweep = ?', (sweep,))
+        return {row[0] for row in rows}
+
+    def add_experiment(self, exp_id, sweep=None):
+        """
+        Record the succeeded simulations of a submitted sweep experiment that carry a point_hash tag
+        :return: number of points recorded
+        """
+        expt = retrieve_experiment(exp_id)
+        rows = [(sim.tags['point_hash'], sweep or expt.exp_name, str(exp_id), str(sim.id), sim.get_path(),
+                 _canonical({k: v for k, v in sim.tags.items() if k != 'point_hash'}))
+                for sim in expt.simulations
+                if 'point_hash' in sim.tags and sim.status == SimulationState.Succeeded]
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def lookup(self, sweep=None):
+        """
+        :return: pandas.DataFrame of completed points with their experiment, simulation and output path
+        """
+        query = 'SELECT point_hash, sweep, exp_id, sim_id, outpath, tags FROM points'
+        params = []
+        if sweep is not None:
+            query += ' WHERE sweep = ?'
+            params.append(sweep)
+        return pd.read_sql_query(query, self.conn, params=params)
+
+    def missing(self, cb, mod_lists, sweep=None):
+        """
+        Filter a sweep down to the points that haven't completed yet
+        :param cb: base config builder, fully set up apart from the swept mods
+        :param mod_lists: iterable of mod lists; consumed lazily
+        :param sweep: only count points completed under this sweep name; any sweep by default
+        :return: generator of the missing points' mod lists, each with a ModFn adding its point_hash tag
+        """
+        return tag_points(cb, mod_lists, skip=self.completed(sweep))
@@ -27,6 +27,9 @@ from simtools.SetupParser import SetupParser
 from ATSB_Effect_Size_Calibration.spline_functions import get_spline_values
 from dtk.interventions.novel_vector_control import add_ATSB
 from ATSB_Effect_Size_Calibration.ATSBEntoCalibSite import ATSBEntoCalibSite
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'bmgf_costing'))
+from atsb_configs import kill_configs, killing_table
 
 
 # Which simtools.ini block to use for this calibration
@@ -145,20 +148,16 @@ def map_sample_to_model_input(cb, sample):
     tags.update({'HalfLife': time})
     box = sample.pop('BoxDuration')
     tags.update({'BoxDuration': box})
-    add_ATSB(cb, start = 517, coverage = 1.0, kill_cfg = {'Species': species,
-                                'Killing_Config': {"class": Class,
-                                                   # This intial effect is the killing rate, but if you're running a
-                                                   # seasonal/piecewise model, the durability map values are multiplied
-                                                   # by this, so set it to 1.0 instead of the killRate value.
-                                                   "Initial_Effect": killRate,
-                                                   #"Initial_Effect": 1.0
-                                                    "Box_Duration": box,
-                                                   "Decay_Time_Constant": time,
-                                                   "Durability_Map": {
-                                                        "Times": [0, wetDur],
-                                                        "Values": [wet, dry]
-                                                    }
-                                }},
+    # This intial effect is the killing rate, but if you're running a seasonal/piecewise model, the durability map
+    # values are multiplied by this, so set it to 1.0 instead of the killRate value.
+    # Parameters the class doesn't use are dropped by the config engine.
+    add_ATSB(cb, start = 517, coverage = 1.0,
+             kill_cfg = kill_configs(killing_table([species], Class,
+                                                   Initial_Effect=killRate,
+                                                   Box_Duration=box,
+                                                   Decay_Time_Constant=time,
+                                                   Times=[0, wetDur],
+                                                   Values=[wet, dry])),
                   duration = 365)
 
     # For testing only, the duration should be handled by the site !! Please remove before running in prod!
@@ -8,6 +8,9 @@ from simtools.Analysis.BaseAnalyzers import BaseAnalyzer
 from simtools.SetupParser import SetupParser
 
 import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'bmgf_costing'))
+from report_json import inset_chart
 
 mpl.rcParams['pdf.fonttype'] = 42
 if not SetupParser.initialized:
@@ -21,15 +24,16 @@ datadir = os.path.join(wdir, 'sim_data')
 
 class VectorCountAnalyzer(BaseAnalyzer):
     def __init__(self):
-        super(VectorCountAnalyzer, self).__init__()
+        super(VectorCountAnalyzer, self).__init__(parse=False)
         self.channel = 'Infected'
         self.filenames = ['output/InsetChart.json']
 
     def select_simulation_data(self, data, simulation):
-        channeldata = data[self.filenames[0]]['Channels'][self.channel]['Data']
+        inset = inset_chart(data[self.filenames[0]], [self.channel], header=['Timesteps'])
+        channeldata = inset['Channels'][self.channel]['Data']
         simdata = pd.DataFrame({self.channel: channeldata,
                                 'time': list(range(len(channeldata))),
-                                'simLength': [[data[self.filenames[0]]['Header']['Timesteps']]]*len(channeldata)})
+                                'simLength': [[inset['Header']['Timesteps']]]*len(channeldata)})
         for tag in ['coverage', 'duration', 'repetitions']:
            simdata[tag] = simulation.tags[tag]
         return simdata
@@ -0,0 +1,115 @@
+"""
+Adaptive refinement of the ATSB killing x larval habitat heatmap.
+
+Instead of a dense killing grid at every burn-in habitat, a sweep starts from a coarse design and is refined from the
+InsetAnalyzer output of the points run so far:
+- along killing, the interval between two neighbouring points of a habitat is halved where the reduction changes by more
+  than tolerance between them
+- along habitat, unused burn-in habitats between two sampled habitats are added where the reduction at a shared killing
+  value changes by more than tolerance
+- seeds are doubled (up to max_seeds) at points whose standard error across seeds is above sem_tolerance
+Reductions are paired by Run_Number against the killing = 0 point of the same habitat, which is always run with the same
+seeds. Refinement stops when no new points are proposed.
+Killing and habitat values are matched on replicate_tuning.habitat_key (6 significant digits), the key the burn-in
+catalog and replicate tuning use, so points map back to their burn-in whatever the habitat's magnitude.
+"""
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'bmgf_costing'))
+from replicate_tuning import habitat_key
+
+XVAR = 'killing'
+YVAR = 'x_Temporary_Larval_Habitat'
+
+
+def _keys(values):
+    return np.array([habitat_key(v) for v in np.asarray(values, dtype=float).ravel()])
+
+
+def coarse_design(habitats, killing_max=0.25, num_killing=9, habitat_stride=4, num_seeds=2):
+    """
+    Starting points: num_killing evenly spaced killing values (including 0) at every habitat_stride-th burn-in habitat,
+    always including the lowest and highest
+    :param habitats: burn-in x_Temporary_Larval_Habitat values
+    :return: pandas.DataFrame with killing, x_Temporary_Larval_Habitat and Run_Number columns
+    """
+    habitats = np.unique(_keys(habitats))
+    idx = np.unique(np.r_[np.arange(0, len(habitats), habitat_stride), len(habitats) - 1])
+    return _points(np.linspace(0, killing_max, num_killing), habitats[idx], range(num_seeds))
+
+
+def _points(killings, habitats, runs):
+    k, h, r = np.meshgrid(_keys(killings), _keys(habitats), list(runs), indexing='ij')
+    return pd.DataFrame({XVAR: k.ravel(), YVAR: h.ravel(), 'Run_Number': r.ravel().astype(int)})
+
+
+def reduction_surface(inset_df, channel='PCR Parasite Prevalence'):
+    """
+    Mean reduction of channel relative to killing = 0 and its standard error across seeds, per (killing, habitat)
+    :param inset_df: InsetAnalyzer output (one row per simulation and time step)
+    :return: pandas.DataFrame with killing, x_Temporary_Larval_Habitat, reduction, sem and seeds columns
+    """
+    keys = [XVAR, YVAR, 'Run_Number']
+    df = inset_df.assign(**{XVAR: inset_df[XVAR].map(habitat_key), YVAR: inset_df[YVAR].map(habitat_key)})
+    per_seed = df.groupby(keys)[channel].mean().reset_index()
+    ref = per_seed[per_seed[XVAR] == 0].drop(columns=XVAR).rename(columns={channel: 'ref'})
+    per_seed = pd.merge(per_seed, ref, on=[YVAR, 'Run_Number'])
+    per_seed['reduction'] = ((per_seed['ref'] - per_seed[channel]) / per_seed['ref']).clip(lower=0)
+
+    surface = per_seed.groupby([XVAR, YVAR])['reduction'].agg(['mean', 'std', 'count']).reset_index()
+    surface = surface.rename(columns={'mean': 'reduction', 'count': 'seeds'})
+    surface['sem'] = (surface['std'] / np.sqrt(surface['seeds'])).fillna(np.inf)
+    return surface.drop(columns='std')
+
+
+def refine(surface, habitats, done, tolerance=0.05, sem_tolerance=0.02, min_killing_step=0.0025, max_seeds=5):
+    """
+    Propose the next batch of points
+    :param surface: reduction_surface of the points run so far
+    :param habitats: all burn-in habitats available for pickup
+    :param done: (killing, habitat, Run_Number) points already run, as a DataFrame
+    :return: pandas.DataFrame of new points (killing, x_Temporary_Larval_Habitat, Run_Number); empty when converged
+    """
+    habitats = np.unique(_keys(habitats))
+    base_seeds = int(surface['seeds'].min())
+    new = []
+
+    # along killing
+    for hab, hdf in surface.sort_values(XVAR).groupby(YVAR):
+        k = hdf[XVAR].to_numpy()
+        r = hdf['reduction'].to_numpy()
+        split = (np.abs(np.diff(r)) > tolerance) & (np.diff(k) >= 2 * min_killing_step)
+        mids = (k[:-1][split] + k[1:][split]) / 2
+        if len(mids):
+            new.append(_points(mids, [hab], range(base_seeds)))
+
+    # along habitat, at the killing values sampled on both sides
+    grid = surface.pivot(index=YVAR, columns=XVAR, values='reduction').sort_index()
+    sampled = grid.index.to_numpy()
+    jumps = (grid.diff().abs().iloc[1:] > tolerance).any(axis=1).to_numpy()
+    for lo, hi in zip(sampled[:-1][jumps], sampled[1:][jumps]):
+        between = habitats[(habitats > lo) & (habitats < hi)]
+        if len(between):
+            killings = grid.columns[grid.loc[[lo, hi]].notnull().any(axis=0)]
+            new.append(_points(killings, [between[len(between) // 2]], range(base_seeds)))
+
+    # seeds where the spread across seeds is too large
+    noisy = surface[(surface['sem'] > sem_tolerance) & (surface['seeds'] < max_seeds)]
+    for _, row in noisy.iterrows():
+        seeds = int(row['seeds'])
+        new.append(_points([row[XVAR]], [row[YVAR]], range(seeds, min(2 * seeds, max_seeds))))
+
+    if not new:
+        return _points([], [], [])
+    new = pd.concat(new)
+
+    # every seed at every habitat also needs its killing = 0 reference
+    new = pd.concat([new, new.assign(**{XVAR: 0.0})]).drop_duplicates()
+    done = done[[XVAR, YVAR, 'Run_Number']].assign(**{XVAR: done[XVAR].map(habitat_key),
+                                                       YVAR: done[YVAR].map(habitat_key)})
+    merged = pd.merge(new, done.drop_duplicates(), how='left', indicator=True)
+    return merged[merged['_merge'] == 'left_only'].drop(columns='_merge').reset_index(drop=True)
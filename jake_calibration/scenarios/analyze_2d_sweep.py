@@ -8,6 +8,9 @@ from simtools.Analysis.BaseAnalyzers import BaseAnalyzer
 from simtools.SetupParser import SetupParser
 
 import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'bmgf_costing'))
+from report_json import inset_chart
 from plotting.colors import load_color_palette
 
 mpl.rcParams['pdf.fonttype'] = 42
@@ -24,13 +27,13 @@ datadir = os.path.join(wdir, 'sim_data')
 class Sweep2DAnalyzer(BaseAnalyzer) :
 
     def __init__(self, sweep_vars):
-        super(Sweep2DAnalyzer, self).__init__()
+        super(Sweep2DAnalyzer, self).__init__(parse=False)
         self.sweep_variables = sweep_vars
         self.channel = 'Adult Vectors'
         self.filenames = ['output/InsetChart.json']
 
     def select_simulation_data(self, data, simulation):
-        channeldata = data[self.filenames[0]]['Channels'][self.channel]['Data']
+        channeldata = inset_chart(data[self.filenames[0]], [self.channel])['Channels'][self.channel]['Data']
         simdata = pd.DataFrame( { self.channel : channeldata,
                                   'time' : list(range(len(channeldata)))})
         for tag in self.sweep_variables + ['Run_Number']:
@@ -4,6 +4,9 @@ from simtools.Analysis.AnalyzeManager import AnalyzeManager
 from simtools.Analysis.BaseAnalyzers import BaseAnalyzer
 from simtools.SetupParser import SetupParser
 import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'bmgf_costing'))
+from report_json import inset_chart
 
 if not SetupParser.initialized:
     SetupParser.init('HPC')
@@ -17,7 +20,7 @@ datadir = os.path.join(wdir, 'sim_data')
 
 class InsetAnalyzer(BaseAnalyzer):
     def __init__(self, expname, channels=None):
-        super(InsetAnalyzer, self).__init__()
+        super(InsetAnalyzer, self).__init__(parse=False)
         self.filenames = ['output/InsetChart.json']
         self.channels = channels if channels else ['PCR Parasite Prevalence', 'True Prevalence',
                                                    'Blood Smear Parasite Prevalence', 'Infected',
@@ -27,7 +30,8 @@ class InsetAnalyzer(BaseAnalyzer):
         self.expname = expname
 
     def select_simulation_data(self, data, simulation):
-        simdata = pd.DataFrame({ x : data[self.filenames[0]]['Channels'][x]['Data'][-578:-213] for x in self.channels })
+        inset = inset_chart(data[self.filenames[0]], self.channels)
+        simdata = pd.DataFrame({ x : inset['Channels'][x]['Data'][-578:-213] for x in self.channels })
         simdata['time'] = simdata.index
 
         for tag in simulation.tags:
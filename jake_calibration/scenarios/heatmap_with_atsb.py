@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import pandas as pd
 import numpy as np
@@ -18,6 +19,12 @@ from dtk.interventions.biting_risk import change_biting_risk
 
 from malaria.reports.MalariaReport import add_summary_report, add_event_counter_report
 from malaria.interventions.malaria_drug_campaigns import add_drug_campaign
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'bmgf_costing'))
+from atsb_configs import kill_configs, killing_table
+from sweep_builders import mod_product, run_sharded
+from sweep_manifest import SweepManifest
+from adaptive_sampling import coarse_design, reduction_surface, refine
+from replicate_tuning import habitat_key
 
 exp_name = 'ATSB_heatmap'
 cb = DTKConfigBuilder.from_defaults('MALARIA_SIM')
@@ -32,6 +39,10 @@ years = 3
 # Start of June in Mali
 start_day = (years - 2) * 365 + 152
 numseeds = 5
+shard_size = 10000
+completed_exp_ids = []  # earlier shards of this heatmap; their completed points are skipped
+adaptive = False  # start from a coarse grid and refine where the reduction surface needs it
+max_iterations = 20  # refinement passes before giving up on convergence
 
 cb.update_params( {
     'Config_Name' : 'ATSB_Kangaba',
@@ -82,10 +93,7 @@ def update_vector_params(cb) :
 def atsb_fn(cb, killing):
 
     add_ATSB(cb, start = start_day,
-             coverage = 1.0, kill_cfg = {'Species': species,
-                                    'Killing_Config': {"class": 'WaningEffectConstant',
-                                                       "Initial_Effect": killing,
-                                    }},
+             coverage = 1.0, kill_cfg = kill_configs(killing_table([species], 'Constant', Initial_Effect=killing)),
              duration = 10000)
     # add_ATSB(cb, coverage=coverage, start=100, duration=365, kill_cfg=killing_cfg[1])
     return {'killing': killing}
@@ -115,28 +123,78 @@ add_summary_report(cb, start=start_day-365, interval=30, age_bins=[125],
 # add_event_counter_report(cb, ['Received_Campaign_Drugs'])
 
 
+def point_mods(points):
+    # one mod list per (killing, habitat, Run_Number) row, picking up from the burn-in of that habitat with the burn-in's
+    # exact habitat; points only carry its key
+    burnins = {habitat_key(h): (h, outpath) for h, outpath in zip(df['x_Temporary_Larval_Habitat'], df['outpath'])}
+    for _, p in points.iterrows():
+        habitat, outpath = burnins[habitat_key(p['x_Temporary_Larval_Habitat'])]
+        yield [ModFn(atsb_fn, float(p['killing'])),
+               ModFn(DTKConfigBuilder.update_params, {
+                   'x_Temporary_Larval_Habitat': float(habitat),
+                   'Run_Number': int(p['Run_Number']),
+                   'Serialized_Population_Path': os.path.join(outpath, 'output')
+               })]
+
+
+def run_adaptive(channel='PCR Parasite Prevalence'):
+
+    from simtools.Analysis.AnalyzeManager import AnalyzeManager
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'analyzers'))
+    from HeatmapAnalyzer import InsetAnalyzer
+
+    habitats = df['x_Temporary_Larval_Habitat'].values
+    points = coarse_design(habitats, num_seeds=2)
+    exp_ids, inset = [], None
+    for iteration in range(max_iterations):
+        print('adaptive iteration %d: %d new simulations' % (iteration, len(points)))
+        managers = run_sharded(cb, '%s_adaptive%d' % (exp_name, iteration), point_mods(points), shard_size=shard_size)
+        for exp_manager in managers:
+            exp_manager.wait_for_finished(verbose=True)
+            assert (exp_manager.succeeded())
+        new_ids = [str(exp_manager.experiment.exp_id) for exp_manager in managers]
+        exp_ids += new_ids
+
+        analyzer = InsetAnalyzer(expname='%s_adaptive%d' % (exp_name, iteration), channels=[channel])
+        AnalyzeManager(new_ids, analyzers=[analyzer]).analyze()
+        new_data = pd.read_csv(os.path.join(analyzer.working_dir, '%s.csv' % analyzer.expname))
+        inset = new_data if inset is None else pd.concat([inset, new_data])
+
+        points = refine(reduction_surface(inset, channel), habitats, inset)
+        if not len(points):
+            break
+    if len(points):
+        print('WARNING: adaptive refinement stopped after %d iterations with %d points still pending; the heatmap has '
+              'not converged (raise max_iterations to continue)' % (max_iterations, len(points)))
+    inset.to_csv(os.path.join(sim_setup_dir, '%s_adaptive_inset.csv' % exp_name), index=False)
+    return exp_ids
+
 
 if __name__ == "__main__":
 
     SetupParser.init('HPC')
 
-    builder = ModBuilder.from_list([[
-        ModFn(atsb_fn, killing),
-        ModFn(DTKConfigBuilder.update_params, {
+    if adaptive:
+        run_adaptive()
+        sys.exit()
+
+    # sims are enumerated shard by shard; each shard is submitted as its own experiment
+    mod_lists = mod_product(
+        [ModFn(DTKConfigBuilder.update_params, {
             'x_Temporary_Larval_Habitat': float(row['x_Temporary_Larval_Habitat']),
             'Run_Number': s,
             'Serialized_Population_Path': os.path.join(row['outpath'], 'output')
-        }),
-    ] for r, row in df.iterrows() for s in range(numseeds) for killing in np.linspace(0, 0.25, 100)
-    ])
+        }) for r, row in df.iterrows() for s in range(numseeds)],
+        [ModFn(atsb_fn, killing) for killing in np.linspace(0, 0.25, 100)])
 
-    run_sim_args = {'config_builder': cb,
-                    'exp_name': exp_name,
-                    'exp_builder': builder
-                    }
+    # every point is tagged with its hash so later runs can skip it; points completed by earlier shards are left out
+    manifest = SweepManifest()
+    for exp_id in completed_exp_ids:
+        manifest.add_experiment(exp_id, sweep=exp_name)
+    mod_lists = manifest.missing(cb, mod_lists, sweep=exp_name)
 
-    exp_manager = ExperimentManagerFactory.init()
-    exp_manager.run_simulations(**run_sim_args)
+    exp_managers = run_sharded(cb, exp_name, mod_lists, shard_size=shard_size)
     # Wait for the simulations to be done
-    exp_manager.wait_for_finished(verbose=True)
-    assert (exp_manager.succeeded())
+    for exp_manager in exp_managers:
+        exp_manager.wait_for_finished(verbose=True)
+        assert (exp_manager.succeeded())
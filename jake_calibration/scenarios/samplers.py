@@ -0,0 +1,136 @@
+"""
+Space-filling designs over the scenario parameters (e.g. ATSB killing x larval habitat).
+
+Parameters are described as in setup.sample_LHC: {name: {'min': .., 'max': .., 'log': bool, 'integer': bool}}. A design
+is drawn on the unit hypercube and then scaled to the parameter ranges, log10-uniformly for 'log' parameters and onto
+the integers min..max for 'integer' ones. Methods:
+- 'lhc': stratified Latin hypercube, one point in each of the numsamples strata of every parameter
+- 'maximin': the Latin hypercube with the largest nearest-neighbour distance out of a number of candidates
+- 'sobol': scrambled Sobol sequence
+Everything is array-based, so designs of several hundred thousand points take seconds. Designs are saved as .npz
+together with the method, seed and parameter ranges they were drawn with, and are reused while those match. Without a
+seed, a fresh one is drawn and saved with the design, so every saved design can be reproduced.
+"""
+
+import json
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from scipy.stats import qmc
+
+METHODS = ['lhc', 'maximin', 'sobol']
+
+
+def latin_hypercube(numsamples, dims, rng):
+    """
+    Stratified Latin hypercube on [0, 1)^dims
+    """
+    strata = rng.permuted(np.tile(np.arange(numsamples), (dims, 1)), axis=1).T
+    return (strata + rng.random((numsamples, dims))) / numsamples
+
+
+def min_distance(points):
+    """
+    Smallest distance between two points of a design
+    """
+    if len(points) < 2:
+        return np.inf
+    distances, _ = cKDTree(points).query(points, k=2)
+    return distances[:, 1].min()
+
+
+def unit_design(method, numsamples, dims, seed=0, candidates=10):
+    """
+    :param method: one of METHODS
+    :param candidates: number of Latin hypercubes compared for 'maximin'
+    :return: (numsamples x dims) array on the unit hypercube
+    """
+    rng = np.random.default_rng(seed)
+    if method == 'lhc':
+        return latin_hypercube(numsamples, dims, rng)
+    if method == 'maximin':
+        designs = [latin_hypercube(numsamples, dims, rng) for _ in range(candidates)]
+        return max(designs, key=min_distance)
+    if method == 'sobol':
+        sampler = qmc.Sobol(dims, scramble=True, seed=rng)
+        m = int(np.ceil(np.log2(max(numsamples, 1))))
+        return sampler.random_base2(m)[:numsamples]
+    raise ValueError('Unknown sampling method %s; expected one of %s' % (method, METHODS))
+
+
+def scale_design(unit, paramdict):
+    """
+    Map a unit-hypercube design onto the parameter ranges
+    :return: pandas.DataFrame with one column per parameter
+    """
+    names = list(paramdict.keys())
+    lo = np.array([paramdict[k]['min'] for k in names], dtype=float)
+    hi = np.array([paramdict[k]['max'] for k in names], dtype=float)
+    log = np.array([bool(paramdict[k].get('log', False)) for k in names])
+    integer = np.array([bool(paramdict[k].get('integer', False)) for k in names])
+    if (log & (lo <= 0)).any():
+        raise ValueError('log-scale parameters need a positive min: %s' % [k for k, l, m in zip(names, log, lo)
+                                                                           if l and m <= 0])
+
+    lo_t = np.where(log, np.log10(np.where(log, lo, 1)), lo)
+    hi_t = np.where(log, np.log10(np.where(log, hi, 1)), hi)
+    values = lo_t + unit * (hi_t - lo_t)
+    values = np.where(log, 10 ** values, values)
+
+    # integers: equal-width bins over min..max inclusive
+    as_int = np.floor(lo + unit * (hi - lo + 1))
+    values = np.where(integer, np.clip(as_int, lo, hi), values)
+
+    df = pd.DataFrame(values, columns=names)
+    for k in np.array(names)[integer]:
+        df[k] = df[k].astype(int)
+    return df
+
+
+def _spec(paramdict, numsamples, method, seed, candidates):
+    return json.dumps({'params': paramdict, 'numsamples': numsamples, 'method': method, 'seed': seed,
+                       'candidates': candidates if method == 'maximin' else None}, sort_keys=True)
+
+
+def load_design(fname):
+    """
+    :return: (DataFrame of samples, spec dict) of a design saved by sample_design
+    """
+    with np.load(fname, allow_pickle=False) as design:
+        df = pd.DataFrame(design['samples'], columns=design['names'].tolist())
+        spec = json.loads(str(design['spec']))
+    for k, v in spec['params'].items():
+        if v.get('integer'):
+            df[k] = df[k].astype(int)
+    return df, spec
+
+
+def sample_design(paramdict, numsamples, method='lhc', seed=0, output_fname='', force=False, candidates=10):
+    """
+    Draw a design, or reuse the one saved in output_fname if it was drawn with the same parameters, size, method and
+    seed
+    :param paramdict: {name: {'min', 'max', 'log', 'integer'}}
+    :param seed: random seed; a fresh one (saved with the design) if None
+    :param output_fname: .npz file to persist the design to
+    :return: pandas.DataFrame with one row per sample and one column per parameter
+    """
+    if output_fname and not output_fname.endswith('.npz'):
+        output_fname += '.npz'  # as np.savez names it
+    if output_fname and not force:
+        try:
+            df, saved = load_design(output_fname)
+            # without a seed, any saved design drawn the same way is reused, whatever seed it was drawn with
+            if _spec(paramdict, numsamples, method, saved['seed'] if seed is None else seed, candidates) == \
+                    json.dumps(saved, sort_keys=True):
+                return df
+        except FileNotFoundError:
+            pass
+
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    spec = _spec(paramdict, numsamples, method, seed, candidates)
+    df = scale_design(unit_design(method, numsamples, len(paramdict), seed, candidates), paramdict)
+    if output_fname:
+        np.savez(output_fname, samples=df.to_numpy(dtype=float), names=np.array(df.columns, dtype=str),
+                 spec=np.array(spec))
+    return df
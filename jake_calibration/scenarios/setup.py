@@ -1,38 +1,27 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
 import matplotlib.pyplot as plt
 
 from input_file_generation.add_properties_to_demographics import generate_demographics_properties
 from sim_output_processing.createSimDirectoryMap import createSimDirectoryMap
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'bmgf_costing'))
+from serialization_catalog import SerializationCatalog
+from samplers import sample_design
 
 userpath = 'D:/'
 
 wdir = os.path.join(userpath, 'Dropbox (IDM)', 'Malaria Team Folder/projects/atsb')
 datadir = os.path.join(wdir, 'sim_data')
 
-def sample_LHC(paramdict, numsamples, output_fname='', force=False) :
+def sample_LHC(paramdict, numsamples, output_fname='', force=False, method='lhc', seed=None) :
 
-    if output_fname and not force :
-        try :
-            df = pd.read_csv(output_fname)
-        except FileNotFoundError :
-            force = True
-
-    if force :
-        df = pd.DataFrame()
-
-        for key, val in paramdict.items() :
-            if 'log' in val and val['log'] :
-                samples = np.logspace(np.log10(val['min']), np.log10(val['max']), numsamples)
-            else :
-                samples = np.linspace(val['min'], val['max'], numsamples)
-            np.random.shuffle(samples)
-            df[key] = samples
-
-        if output_fname :
-            df.to_csv(output_fname, index=False)
-    return df
+    # stratified LHC (or a 'maximin' / 'sobol' design) from samplers, saved as .npz (a .csv output_fname is saved as
+    # .npz next to it) together with its seed, which is drawn fresh when not given; samplers.load_design reads it back
+    if output_fname.endswith('.csv') :
+        output_fname = output_fname[:-len('.csv')] + '.npz'
+    return sample_design(paramdict, numsamples, method=method, seed=seed, output_fname=output_fname, force=force)
 
 def generate_samples(output_fname) :
 
@@ -68,6 +57,16 @@ def add_serialization_paths_to_hab_csv(fname, expid) :
     df = df.rename(columns={'outpath' : 'serialized file dir'})
     df.to_csv(fname, index=False)
 
+def write_burnin_csv(expid, output_fname, site='Kangaba') :
+
+    # serialized paths come from the shared local catalog; COMPS is only queried the first time an experiment is seen
+    catalog = SerializationCatalog()
+    if not catalog.has_experiment(expid) :
+        catalog.add_experiment(expid, site=site)
+    df = catalog.lookup(exp_id=expid)
+    df.drop(columns=['state_files']).to_csv(output_fname, index=False)
+    return df
+
 if __name__ == '__main__' :
 
     expid = '58f94e3f-9aa0-e811-a2c0-c4346bcb7275'
@@ -75,5 +74,4 @@ if __name__ == '__main__' :
     output_fname = os.path.join(datadir, 'LH_burnin.csv')
     # add_serialization_paths_to_hab_csv(output_fname, expid)
 
-    df = createSimDirectoryMap(expid, is_name=False)
-    df.to_csv(output_fname, index=False)
\ No newline at end of file
+    df = write_burnin_csv(expid, output_fname)
\ No newline at end of file
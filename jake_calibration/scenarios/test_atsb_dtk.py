@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import pandas as pd
 import numpy as np
@@ -12,6 +13,8 @@ from simtools.ModBuilder import ModBuilder, ModFn
 from dtk.vector.study_sites import configure_site
 from dtk.interventions.novel_vector_control import add_ATSB
 from dtk.vector.species import update_species_param
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'bmgf_costing'))
+from atsb_configs import kill_configs, killing_table
 
 
 exp_name = 'atsb_campaign_class_test'
@@ -32,28 +35,14 @@ update_species_param(cb, 'gambiae', 'Vector_Sugar_Feeding_Frequency', 'VECTOR_SU
 
 def atsb_fn(cb, coverage, killing) :
 
-    killing_cfg = [{
-            "Species" : 'funestus',
-            "Killing_Config" : {
-                "class": "WaningEffectMapLinearSeasonal",
-                "Initial_Effect" : 1.0,
-                "Durability_Map" :
-                {
-                    "Times"  : [ 0.0, 90.0, 91.0, 300.0, 301.0, 365.0 ],
-                    "Values" : [ 1.0, 1.0,   0.01,  0.01,  1.0,   1.0 ]
-                }
-            }
-    },
-        {
-        "Species" : 'gambiae',
-            "Killing_Config" : {
-                "class": "WaningEffectBoxExponential",
-                "Initial_Effect": killing,
-                "Box_Duration": 180,
-                "Decay_Time_Constant": 30
-            }
-        }
-        ]
+    # funestus: seasonal map (off from day 91 to 300); gambiae: box-exponential from the swept killing
+    killing_cfg = kill_configs(killing_table(
+        ['funestus', 'gambiae'], ['MapLinearSeasonal', 'BoxExponential'],
+        Initial_Effect=[1.0, killing],
+        Box_Duration=180,
+        Decay_Time_Constant=30,
+        Times=[0.0, 90.0, 91.0, 300.0, 301.0, 365.0],
+        Values=[1.0, 1.0, 0.01, 0.01, 1.0, 1.0]))
 
     add_ATSB(cb, coverage=coverage, start=100, duration=365,
              kill_cfg=killing_cfg